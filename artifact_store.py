@@ -0,0 +1,230 @@
+'''
+The directory of intermediate files: renders, processed maps, converted
+textures. Normally $OOT/build/oot-scene-tool.
+
+Files are made under readable names like miniraw_0_1_2.png, which is
+where renderers and processors write them. Once made, they're committed
+to the store: the contents are moved into a blob named by its SHA-1 and
+the named file becomes a hard link to it, so identical images (there
+are lots of empty layers) are only stored once. Committed files are
+read-only, since writing one in place would change every name sharing
+its blob; to remake one, release it first (render_cache does this).
+
+index.json records each name's blob, size, when it was last used, and
+any metadata saved with it (see render_cache). Once the blobs add up to
+more than max_bytes, the least recently used names are evicted, except
+ones used by this session.
+
+Everything that reads or writes index.json holds a lock file, so two
+Blender sessions or a batch run can share a store.
+'''
+import json
+import os
+import shutil
+import stat
+import time
+
+from .common_utils import *
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+default_max_bytes = 512 << 20
+
+
+class ArtifactStore:
+    def __init__(self, root, max_bytes=default_max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.blob_dir = os.path.join(root, 'blobs')
+        self.index_path = os.path.join(root, 'index.json')
+        self.lock_path = os.path.join(root, '.lock')
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+        # Names this session has used. These are never evicted, since
+        # we're probably about to install them.
+        self.in_use = set()
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def name_of(self, path):
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    @contextlib.contextmanager
+    def locked_index(self):
+        '''
+        Hold the store's lock, and yield the index for reading and
+        changing. Changes are written back when the block ends.
+        '''
+        with open(self.lock_path, 'a+b') as lock:
+            if fcntl:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            else:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+
+            try:
+                try:
+                    with open(self.index_path, 'rt') as f:
+                        index = json.load(f)
+                except (FileNotFoundError, ValueError):
+                    index = {}
+
+                before = json.dumps(index, sort_keys=True)
+                yield index
+
+                if json.dumps(index, sort_keys=True) != before:
+                    with atomic_write(self.index_path, 'wt') as f:
+                        json.dump(index, f, indent=1, sort_keys=True)
+
+            finally:
+                if fcntl:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock.seek(0)
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def meta(self, path):
+        '''Metadata committed with the file at path, or None.'''
+        with self.locked_index() as index:
+            entry = index.get(self.name_of(path))
+            if entry and os.path.exists(path):
+                return entry.get('meta')
+        return None
+
+    def touch(self, paths):
+        '''Mark files as just used, so they're the last to be evicted.'''
+        now = time.time()
+        with self.locked_index() as index:
+            for path in paths:
+                name = self.name_of(path)
+                self.in_use.add(name)
+                if name in index:
+                    index[name]['used'] = now
+
+    def release(self, paths):
+        '''
+        Forget files that are about to be remade. The named files are
+        removed rather than overwritten, since they're links to blobs
+        other names might share.
+        '''
+        with self.locked_index() as index:
+            blobs = set()
+            for path in paths:
+                entry = index.pop(self.name_of(path), None)
+                if entry:
+                    blobs.add(entry['blob'])
+                if os.path.lexists(path):
+                    remove(path)
+            self.gc_blobs(index, blobs)
+
+    def commit(self, paths, meta=None):
+        '''
+        Move freshly made files into blobs, and record them. meta is
+        saved with the first path.
+        '''
+        now = time.time()
+        with self.locked_index() as index:
+            for i, path in enumerate(paths):
+                name = self.name_of(path)
+                blob = self.store_blob(path)
+                index[name] = {
+                    'blob': blob,
+                    'size': os.path.getsize(path),
+                    'used': now,
+                }
+                if i == 0 and meta is not None:
+                    index[name]['meta'] = meta
+                self.in_use.add(name)
+
+            self.evict(index)
+
+    def store_blob(self, path):
+        h = file_hash(path)
+        _, ext = os.path.splitext(path)
+        blob = f'{h}{ext}'
+        blob_path = os.path.join(self.blob_dir, blob)
+
+        # Put a link to the file's contents at blob_path if it isn't
+        # there yet, then make the named file a link to the blob.
+        if not os.path.exists(blob_path):
+            tmp_path = blob_path + '.tmp'
+            link_or_copy(path, tmp_path)
+            make_read_only(tmp_path)
+            os.replace(tmp_path, blob_path)
+
+        if not os.path.samefile(path, blob_path):
+            tmp_path = path + '.tmp'
+            link_or_copy(blob_path, tmp_path)
+            make_read_only(tmp_path)
+            replace(tmp_path, path)
+
+        # A hard link shares the blob's permissions, but a copy doesn't
+        make_read_only(path)
+
+        return blob
+
+    def evict(self, index):
+        blob_sizes = {entry['blob']: entry['size'] for entry in index.values()}
+        total = sum(blob_sizes.values())
+        if total <= self.max_bytes:
+            return
+
+        by_age = sorted(index, key=lambda name: index[name]['used'])
+        for name in by_age:
+            if total <= self.max_bytes:
+                break
+            if name in self.in_use:
+                continue
+
+            blob = index.pop(name)['blob']
+            path = self.path(name)
+            if os.path.lexists(path):
+                remove(path)
+            log(f"Evicted {name}")
+
+            if not any(entry['blob'] == blob for entry in index.values()):
+                total -= blob_sizes[blob]
+                blob_path = os.path.join(self.blob_dir, blob)
+                if os.path.exists(blob_path):
+                    remove(blob_path)
+
+    def gc_blobs(self, index, blobs):
+        '''Delete whichever of blobs no name in index refers to any more.'''
+        used = set(entry['blob'] for entry in index.values())
+        for blob in blobs - used:
+            blob_path = os.path.join(self.blob_dir, blob)
+            if os.path.exists(blob_path):
+                remove(blob_path)
+
+
+def make_read_only(path):
+    os.chmod(path, stat.S_IMODE(os.stat(path).st_mode) & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+def remove(path):
+    # Windows won't remove read-only files
+    if os.name == 'nt':
+        os.chmod(path, stat.S_IWRITE)
+    os.remove(path)
+
+
+def replace(from_path, to_path):
+    if os.name == 'nt' and os.path.lexists(to_path):
+        os.chmod(to_path, stat.S_IWRITE)
+    os.replace(from_path, to_path)
+
+
+def link_or_copy(from_path, to_path):
+    if os.path.lexists(to_path):
+        remove(to_path)
+    try:
+        os.link(from_path, to_path)
+    except OSError:
+        # Some filesystems can't do hard links
+        shutil.copyfile(from_path, to_path)
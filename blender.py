@@ -43,7 +43,7 @@ if not pil_installed:
 # ------------------------
 # Why does anyone think Python is good
 import oot_scene_tool
-from oot_scene_tool import scene, scene_map, app, utils, z64c, text, scene_split, lighting, blender
+from oot_scene_tool import scene, scene_map, app, utils, z64c, text, scene_split, lighting, blender, manifest, vertex_bake
 
 from .text import render_text
 
@@ -79,18 +79,26 @@ def reload_this_tool():
 reload_this_tool()
 
 
+# Let SceneMaps know which objects changed, so they only hash the
+# geometry of those again. Take out the handler from before a reload.
+for handler in list(bpy.app.handlers.depsgraph_update_post):
+    if getattr(handler, '__name__', None) == 'forget_updated_objects':
+        bpy.app.handlers.depsgraph_update_post.remove(handler)
+bpy.app.handlers.depsgraph_update_post.append(scene_map.forget_updated_objects)
+
+
 # GO GO GO
 # --------
 log = utils.log
 
 
 @contextlib.contextmanager
-def with_scene():
+def with_scene(split=True):
     app.scene = scene.Scene(
         bpy.context.scene
     )
 
-    if scene_split.can_split(app.scene):
+    if split and scene_split.can_split(app.scene):
         scene_split.split(app.scene)
 
     yield
@@ -124,7 +132,7 @@ def define_operator(fn):
         bl_idname = f'foon.{snake}'
         bl_label = title
         def execute(self, context):
-            with with_scene():
+            with with_scene(split=not getattr(fn, 'splits_after', False)):
                 fn() # <-- The actual thing we wanted to do
             return {'FINISHED'}   
 
@@ -135,6 +143,15 @@ def define_operator(fn):
     return Op
 
 
+def splits_after(fn):
+    """
+    For operators that change Geom and split the rooms again at the
+    end, so with_scene doesn't split them beforehand as well.
+    """
+    fn.splits_after = True
+    return fn
+
+
 @define_operator
 def install_pil():
     global pil_installed
@@ -152,28 +169,44 @@ def reload_tool():
 
 
 @define_operator
+@splits_after
 def bake_ao():
-    name = 'AO'
-    app.scene.blender_scene.render.engine = 'CYCLES'
-    app.scene.blender_scene.cycles.bake_type = 'AO'
-    app.scene.blender_scene.render.bake.target = 'VERTEX_COLORS'
+    blender_scene = app.scene.blender_scene
+    vertex_bake.bake_ao(app.scene, vertex_bake.AOSettings(
+        samples=blender_scene.rgaAOSamples,
+        distance=blender_scene.rgaAODistance,
+        falloff=blender_scene.rgaAOFalloff,
+    ))
+
+    # AO was baked into Geom, so split the rooms now to get it
+    if scene_split.can_split(app.scene):
+        scene_split.split(app.scene)
 
-    mesh = bpy.context.active_object.data
-    ao = mesh.color_attributes.get(name)
-    if not ao:
-        ao = mesh.color_attributes.new(name, 'FLOAT_COLOR', 'CORNER')
 
-    mesh.color_attributes.active = ao
+@define_operator
+@splits_after
+def bake_lighting():
+    vertex_bake.bake_lights(app.scene, vertex_bake.LightSettings(
+        ambient=tuple(app.scene.blender_scene.rgaLightAmbient),
+    ))
 
-    bpy.ops.object.bake('AO')
+    # Like AO, lighting is baked into Geom if there is one
+    if scene_split.can_split(app.scene):
+        scene_split.split(app.scene)
 
 
 @define_operator
+@splits_after
 def merge_vertex_colors():
     lighting.merge_vertex_colors(app.scene)
 
+    # The rooms take their colours from Geom
+    if scene_split.can_split(app.scene):
+        scene_split.split(app.scene)
+
 
 @define_operator
+@splits_after
 def split_rooms():
     scene_split.split(app.scene)
 
@@ -187,7 +220,11 @@ def move_actors_to_rooms():
 def render_maps():
     map_ = scene_map.SceneMap(app.scene)
     map_.render_all()
-    z64c.install_diffs(app.scene.oot_dir, map_.diffs)
+
+    # Save the diffs too, so they can be reinstalled without Blender
+    # after cleaning the decomp; see manifest.py.
+    diffs = manifest.save(app.scene.manifest_path, map_.diffs)
+    z64c.install_diffs(app.scene.oot_dir, diffs)
 
 
 @define_operator
@@ -228,6 +265,56 @@ bpy.types.Scene.rgaSceneName = bpy.props.StringProperty(
     name="Scene Display Name"
 )
 
+bpy.types.Scene.rgaMapRenderer = bpy.props.EnumProperty(
+    name="Map Renderer",
+    items=[
+        ('RASTER', "Rasterizer", "Draw map silhouettes directly. Fast, no GPU needed"),
+        ('CYCLES', "Cycles", "Render maps with Cycles"),
+    ],
+    default='CYCLES'
+)
+
+bpy.types.Scene.rgaArtifactCacheMB = bpy.props.IntProperty(
+    name="Render Cache Size (MB)",
+    description="Least recently used renders are deleted once build/oot-scene-tool gets bigger than this",
+    default=512,
+    min=1
+)
+
+bpy.types.Scene.rgaAOSamples = bpy.props.IntProperty(
+    name="AO Samples",
+    description="Rays cast from each corner when baking AO",
+    default=16,
+    min=1
+)
+
+bpy.types.Scene.rgaAODistance = bpy.props.FloatProperty(
+    name="AO Distance",
+    description="Geometry further away than this doesn't occlude",
+    default=200.0,
+    min=0.001
+)
+
+bpy.types.Scene.rgaAOFalloff = bpy.props.FloatProperty(
+    name="AO Falloff",
+    description="How quickly occlusion fades with distance. 0 means anything within AO Distance occludes fully",
+    default=1.0,
+    min=0.0
+)
+
+bpy.types.Scene.rgaLightAmbient = bpy.props.FloatVectorProperty(
+    name="Ambient Light",
+    description="Light added to every vertex by Bake Lighting, lit or not",
+    subtype='COLOR',
+    default=(0.3, 0.3, 0.3),
+    min=0.0
+)
+
+bpy.types.Mesh.rgaColorStack = bpy.props.StringProperty(
+    name="Vertex Colour Stack",
+    description="How Col is made from other colour attributes, e.g. \"AO multiply, Bounce add, clamp\". Blank means \"AO multiply, Multiply multiply\"",
+)
+
 
 import random
 fuck_you = random.randint(0, 1000)
@@ -255,5 +342,13 @@ class OOT_SCENE_TOOL_PT_panel(bpy.types.Panel):
             col.operator(operator.bl_idname)
 
         col.prop(context.scene, "rgaSceneName")
+        col.prop(context.scene, "rgaMapRenderer")
+        col.prop(context.scene, "rgaArtifactCacheMB")
+        col.prop(context.scene, "rgaAOSamples")
+        col.prop(context.scene, "rgaAODistance")
+        col.prop(context.scene, "rgaAOFalloff")
+        col.prop(context.scene, "rgaLightAmbient")
+        if context.active_object and context.active_object.type == 'MESH':
+            col.prop(context.active_object.data, "rgaColorStack")
         col.prop(context.scene, "rgaProjectDir")
 
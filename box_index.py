@@ -0,0 +1,138 @@
+'''
+Find which boxes a point or a bunch of bounds fall in, without testing
+every box.
+
+Boxes are put in a uniform grid over their XY extent, so a query only
+tests the boxes in the cells it covers. Each box has an owner (for
+catchment boxes, its room), and queries return owners.
+
+Doesn't need bpy; see Scene.catchment_index for the Blender side.
+'''
+import numpy as np
+
+
+# Most cells per axis; more than this just wastes memory.
+max_cells = 64
+
+
+class BoxIndex:
+    def __init__(self, bounds, owners):
+        '''bounds: a Bounds per box. owners: the owner of each box.'''
+        self.owners = list(owners)
+        self.lo = np.array([[axis.min for axis in b.axes] for b in bounds]).reshape(-1, 3)
+        self.hi = np.array([[axis.max for axis in b.axes] for b in bounds]).reshape(-1, 3)
+
+        # Owner number of each box, numbered in the order owners first
+        # appear, which is the order queries return them in.
+        self.unique_owners = list(dict.fromkeys(self.owners))
+        owner_numbers = {owner: i for i, owner in enumerate(self.unique_owners)}
+        self.box_owner = np.array(
+            [owner_numbers[owner] for owner in self.owners],
+            dtype=np.int64
+        )
+
+        if len(self.owners) == 0:
+            self.origin = np.zeros(2)
+            self.cell_size = np.ones(2)
+            self.shape = (1, 1)
+        else:
+            # Cells about the size of a typical box
+            self.origin = self.lo[:, :2].min(axis=0)
+            extent = self.hi[:, :2].max(axis=0) - self.origin
+            typical = np.median(self.hi[:, :2] - self.lo[:, :2], axis=0)
+            shape = np.clip(np.ceil(extent / np.maximum(typical, 1e-6)), 1, max_cells)
+            self.shape = tuple(int(n) for n in shape)
+            self.cell_size = np.maximum(extent / shape, 1e-6)
+
+        self.cell_boxes = [[] for _ in range(self.shape[0] * self.shape[1])]
+        for box, ((x0, y0), (x1, y1)) in enumerate(zip(
+            self.cells_of(self.lo), self.cells_of(self.hi)
+        )):
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    self.cell_boxes[x * self.shape[1] + y].append(box)
+        self.cell_boxes = [np.array(boxes, dtype=np.int64) for boxes in self.cell_boxes]
+
+    def cells_of(self, points):
+        '''Grid cell of each point, clamped to the grid.'''
+        cells = np.floor((np.asarray(points)[..., :2] - self.origin) / self.cell_size)
+        return np.clip(cells, 0, np.array(self.shape) - 1).astype(np.int64)
+
+    def cell_number(self, cells):
+        return cells[..., 0] * self.shape[1] + cells[..., 1]
+
+    def at_point(self, point):
+        '''Owners of boxes containing point, like Bounds.contains.'''
+        point = np.asarray(point, dtype=np.float64)[:3]
+        boxes = self.cell_boxes[self.cell_number(self.cells_of(point))]
+        inside = ((self.lo[boxes] <= point) & (point < self.hi[boxes])).all(axis=1)
+        return self.owners_of(boxes[inside])
+
+    def touching(self, bounds):
+        '''Owners of boxes touching bounds, like bounds_intersection.'''
+        lo = np.array([[axis.min for axis in bounds.axes]])
+        hi = np.array([[axis.max for axis in bounds.axes]])
+        _, boxes = self.touching_each(lo, hi)
+        return self.owners_of(boxes)
+
+    def touching_each(self, lo, hi):
+        '''
+        Which boxes each of a bunch of bounds touch, given as (N, 3)
+        arrays of mins and maxes. Returns matching arrays of bounds
+        numbers and box numbers, one pair per touch.
+        '''
+        lo = np.asarray(lo, dtype=np.float64).reshape(-1, 3)
+        hi = np.asarray(hi, dtype=np.float64).reshape(-1, 3)
+        c0 = self.cells_of(lo)
+        c1 = self.cells_of(hi)
+
+        items = []
+        boxes = []
+
+        def test(group, candidates):
+            touch = (
+                (lo[group, None] <= self.hi[None, candidates])
+                & (hi[group, None] >= self.lo[None, candidates])
+            ).all(axis=2)
+            i, j = np.nonzero(touch)
+            items.append(group[i])
+            boxes.append(candidates[j])
+
+        # Most bounds are much smaller than a cell, so group them by
+        # cell and test each group against just that cell's boxes.
+        single = np.flatnonzero((c0 == c1).all(axis=1))
+        cell = self.cell_number(c0[single])
+        order = np.argsort(cell, kind='stable')
+        single, cell = single[order], cell[order]
+        cells, starts = np.unique(cell, return_index=True)
+        for c, group in zip(cells, np.split(single, starts[1:])):
+            if len(self.cell_boxes[c]):
+                test(group, self.cell_boxes[c])
+
+        # The rest span cells; there shouldn't be many.
+        spanning = np.flatnonzero(~(c0 == c1).all(axis=1))
+        if len(spanning) and len(self.owners):
+            test(spanning, np.arange(len(self.owners)))
+
+        if not items:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(items), np.concatenate(boxes)
+
+    def items_by_owner(self, lo, hi):
+        '''
+        For a bunch of bounds, the sorted numbers of the ones touching
+        each owner's boxes, as a dict. Owners nothing touches are left
+        out.
+        '''
+        items, boxes = self.touching_each(lo, hi)
+        owner = self.box_owner[boxes]
+        order = np.argsort(owner, kind='stable')
+        owner, items = owner[order], items[order]
+        owners, starts = np.unique(owner, return_index=True)
+        return {
+            self.unique_owners[i]: np.unique(group)
+            for i, group in zip(owners, np.split(items, starts[1:]))
+        }
+
+    def owners_of(self, boxes):
+        return [self.unique_owners[i] for i in np.unique(self.box_owner[boxes])]
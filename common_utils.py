@@ -1,8 +1,11 @@
 from dataclasses import dataclass
 from functools import cached_property
 
+import contextlib
+import hashlib
 import os
 import sys
+import tempfile
 
 
 log_file = None
@@ -25,6 +28,70 @@ def cache_as_property(property_name):
     return decorator
 
 
+def cached_by_file(fn):
+    """
+    Cache fn(path) until the file at path changes. Changes are spotted by
+    mtime and size, so a cache hit only costs a stat().
+    """
+    cache = {}
+    def wrap(path):
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size)
+        cached = cache.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+        r = fn(path)
+        cache[path] = (key, r)
+        return r
+    wrap.__name__ = fn.__name__
+    wrap.cache = cache
+    return wrap
+
+
+def file_hash(path):
+    """SHA-1 of a file's contents, as hex, or None if it doesn't exist."""
+    h = hashlib.sha1()
+    try:
+        with open(path, 'rb') as f:
+            while chunk := f.read(1 << 20):
+                h.update(chunk)
+    except FileNotFoundError:
+        return None
+    return h.hexdigest()
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode):
+    """
+    Open a temporary file next to path for writing, and move it over
+    path once it's been written. Readers (and make) never see a
+    partially written file.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path),
+        prefix='.' + os.path.basename(path) + '.',
+        suffix='.tmp'
+    )
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+
+        # mkstemp makes the file private; give it the permissions the
+        # file would have had if we'd written it normally.
+        if os.path.exists(path):
+            permissions = os.stat(path).st_mode & 0o777
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            permissions = 0o666 & ~umask
+        os.chmod(tmp_path, permissions)
+
+        os.replace(tmp_path, path)
+    except:
+        os.unlink(tmp_path)
+        raise
+
+
 def log(*a, **kw):
     if 'file' in kw:
         print(*a, **kw)
@@ -2,14 +2,11 @@ from dataclasses import dataclass
 
 import itertools
 
-import PIL.Image
-import PIL.ImageDraw
-import PIL.ImageFilter
-
-from . import app
-from . import image_utils
+from . import minimap_images
 from . import minimap_utils
+from . import render_cache
 from . import z64c
+from . import z64tex
 
 from .scene_map import MapCamera, Image
 from .utils import *
@@ -58,30 +55,11 @@ class DungeonMinimap:
     @cached_property
     @yield_list
     def diffs(self):
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
-            'sDgnMinimapCount',
-            self.index,
-            len(self.pages)
-        )
+        map_data = self.scene_map.map_data
 
-        # All tex index offsets could potentially need to change.
-        # Recalculate them from the minimap counts.
-        sDgnMinimapCount = z64c.read_array(
-            app.scene.oot_dir,
-            'src/code/z_map_data.c',
-            'sDgnMinimapCount'
-        )
-        sDgnMinimapCount[self.index] = len(self.pages)
-        sDgnMinimapTexIndexOffset = [
-            sum(sDgnMinimapCount[0:i])
-            for i in range(10)
-        ]
-        yield z64c.CArray(
-            'src/code/z_map_data.c',
-            'sDgnMinimapTexIndexOffset',
-            sDgnMinimapTexIndexOffset
-        )
+        # Setting the count also recalculates sDgnMinimapTexIndexOffset,
+        # since every later dungeon's textures might have moved.
+        map_data.set('sDgnMinimapCount', self.index, len(self.pages))
 
         # Output world-to-compass-mark transforms. These tell OOT
         # how to transform objects' world positions to draw the
@@ -99,8 +77,7 @@ class DungeonMinimap:
             for page in self.pages
         ]
 
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sRoomCompassOffsetX',
             self.index,
             [
@@ -109,8 +86,7 @@ class DungeonMinimap:
             ]
         )
 
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sRoomCompassOffsetY',
             self.index,
             [
@@ -136,8 +112,7 @@ class DungeonMinimap:
                 "Compass scale is zero; ROM will crash."
             )
 
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sDgnCompassInfo',
             self.index,
             [
@@ -147,13 +122,6 @@ class DungeonMinimap:
         )
 
         # MAP MARKS
-        gMapMarkDataTable = z64c.read_array(
-            app.scene.oot_dir,
-            'src/overlays/misc/ovl_map_mark_data/z_map_mark_data.c',
-            'gMapMarkDataTable'
-        )
-        map_mark_array_name = gMapMarkDataTable[self.index]
-
         map_mark_data = []
         
         for transform, page in zip(transforms, self.pages):
@@ -196,11 +164,7 @@ class DungeonMinimap:
 
             page_mark_data.append(['MAP_MARK_NONE', 0, [0]])
 
-        yield z64c.CArray(
-            'src/overlays/misc/ovl_map_mark_data/z_map_mark_data.c',
-            map_mark_array_name,
-            map_mark_data
-        )
+        map_data.set_map_marks(self.index, map_mark_data)
 
 
         # LAYER SWITCHING
@@ -234,15 +198,13 @@ class DungeonMinimap:
                 "Too many layer switches in scene. Use fewer tall rooms."
             )
 
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sSwitchEntryCount',
             self.index,
             len(layer_switches)
         )
 
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sSwitchFromFloor',
             self.index,
             [
@@ -259,8 +221,7 @@ class DungeonMinimap:
             return index_where(self.pages, lambda page: page.layer == layer)
             
 
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sSwitchFromRoom',
             self.index,
             [
@@ -269,8 +230,7 @@ class DungeonMinimap:
             ]
         )
 
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sSwitchToRoom',
             self.index,
             [
@@ -297,12 +257,18 @@ class DungeonMinimap:
                 to_path=to_path
             )
 
-        # ZAPD will create .inc.c files from the PNGs when we build
-        # OOT. Include these in the map_i_static file.
+        # We've already converted the PNGs to .inc.c files, so install
+        # those too and ZAPD won't need to when we build OOT. Include
+        # them in the map_i_static file.
         map_i_static_includes = [
             x.replace('.png', '.inc.c')
             for x in map_i_static_pngs
         ]
+        for page, include in zip(self.pages, map_i_static_includes):
+            yield z64c.InstallFile(
+                from_path=page.final_image.inc_c_path,
+                to_path='build/' + include
+            )
         yield z64c.ReplaceIncludes(
             path='assets/textures/map_i_static/map_i_static.c',
             names=[
@@ -312,7 +278,7 @@ class DungeonMinimap:
                 for page in self.pages
             ],
             includes=map_i_static_includes,
-            first_index=sDgnMinimapTexIndexOffset[self.index]
+            first_index=map_data['sDgnMinimapTexIndexOffset'][self.index]
         )
                 
 
@@ -366,140 +332,26 @@ class DungeonMinimap:
 
         log("Process DUNGEON MINIMAP cameras")
         for page in self.pages:
-            page.shift = process_image(
-                page.camera.image.render_path,
-                page.final_image.render_path
+            def process():
+                shift = minimap_images.process_dungeon_minimap(
+                    page.camera.image.render_path,
+                    page.final_image.render_path
+                )
+                z64tex.convert(
+                    page.final_image.render_path,
+                    page.final_image.inc_c_path,
+                    'i4'
+                )
+                return list(shift)
+
+            shift = self.scene_map.render_cache.get(
+                page.final_image.name,
+                [page.final_image.render_path, page.final_image.inc_c_path],
+                render_cache.key_of(
+                    'dungeon minimap',
+                    minimap_images.dungeon_minimap_version,
+                    file_hash(page.camera.image.render_path)
+                ),
+                process
             )
-
-
-def process_image(raw_path, processed_path):
-    """
-    Take a raw camera render and turn it into a stylized
-    map for use in the game.
-
-    This is only for dungeon minimaps; overworld minimaps
-    are different enough that they have their own function.
-    """
-    raw_rgba = PIL.Image.open(raw_path)
-    raw_void, raw_surface, _, raw_alpha = raw_rgba.split()
-
-    out_image = PIL.Image.new('P', raw_alpha.size)
-    out_image.putpalette(image_utils.ci4_palette)
-
-    w, h = out_image.size
-
-    # Fill, outline, and find bounds
-    x0 = None
-    y0 = None
-    x1 = None
-    y1 = None
-    has_void = False
-    for y in range(h):
-        for x in range(w):
-            p = (x, y)
-            in_alpha = raw_alpha.getpixel(p)
-            if in_alpha == 0:
-
-                if any(
-                    image_utils.get(raw_alpha, (x+dx, y+dy), 0) != 0
-                    for (dx, dy) in image_utils.dirs8
-                ):
-                    out_image.putpixel(p, 15)
-
-                    if x0 is None or p[0] < x0: x0 = p[0]
-                    if x1 is None or p[0] > x1: x1 = p[0]
-                    if y0 is None or p[1] < y0: y0 = p[1]
-                    if y1 is None or p[1] > y1: y1 = p[1]
-
-
-            else:
-                if raw_void.getpixel(p) > 128:
-
-                    if any(
-                        image_utils.get(raw_surface, (x+dx, y+dy), 0) >= 128
-                        for (dx, dy) in image_utils.dirs8
-                    ):
-                        out_image.putpixel(p, 15)
-                    else:
-                        out_image.putpixel(p, 0)
-
-                    has_void = True
-
-                else:
-                    out_image.putpixel(p, 4)
-
-
-    if x0 is None:
-        # Empty image
-        pass
-
-    else:
-        bounds = Rect.bounding_points(
-            Vec2(x0, y0),
-            Vec2(x1, y1)
-        )
-
-        bounds = bounds.expand(5)
-
-        bounds.size.x -= 1
-        bounds.size.y -= 1
-
-        # Draw border
-        draw = PIL.ImageDraw.Draw(out_image)
-        draw.rectangle(
-            ((bounds.min.x, bounds.min.y),
-                (bounds.max.x, bounds.max.y)),
-            outline=15
-        )
-
-        # Blur
-        halo = PIL.Image.new('L', out_image.size)
-        for y in range(h):
-            for x in range(w):
-
-                pix = max(raw_alpha.getpixel((x, y)),
-                            out_image.getpixel((x, y)))
-
-                if pix != 0 or any(
-                    image_utils.get(raw_alpha, (x+dx, y+dy), 0)
-                    for (dx, dy) in image_utils.dirs4
-                ):
-                    halo.putpixel((x, y), 0xb0)
-
-        draw = PIL.ImageDraw.Draw(halo)
-        draw.rectangle(
-            ((bounds.min.x, bounds.min.y),
-                (bounds.max.x, bounds.max.y)),
-            outline=0x10
-        )
-        halo = halo.filter(PIL.ImageFilter.GaussianBlur(1))
-
-        # Composite out_image onto its halo
-        for y in range(h):
-            for x in range(w):
-                p = out_image.getpixel((x, y))
-                mask = raw_alpha.getpixel((x, y))
-                if p != 0 or mask != 0:
-                    halo.putpixel((x, y), p * 16)
-
-        out_image = halo
-
-        # Shift to lower-right
-        shift_x = w - 2 - bounds.max.x
-        shift_y = h - 2 - bounds.max.y
-
-        shift = mathutils.Vector((shift_x, shift_y))
-
-        out_image = out_image.transform(
-            (w, h),
-            PIL.Image.AFFINE,
-            (1, 0, -shift_x,
-                0, 1, -shift_y),
-            fillcolor=0
-        )
-
-    # ZAPD doesn't like grayscale PNGs
-    out_image = out_image.convert('RGB')
-    out_image.save(processed_path)
-
-    return shift
+            page.shift = mathutils.Vector(shift)
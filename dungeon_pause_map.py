@@ -3,14 +3,13 @@ from dataclasses import dataclass
 import bpy
 import mathutils
 
-import PIL.Image
-
 from .scene_map import MapCamera, Image
 from .utils import *
 
-from . import image_utils
+from . import minimap_images
 from . import z64c
-from . import app
+from . import z64tex
+from . import render_cache
 from . import text
 
 
@@ -107,10 +106,7 @@ class DungeonPauseMap:
                 Image(key=('pause_right', self.scene.index, floor.index)),
             ]
 
-            c_halves = [
-                half.render_path.replace('.png', '.inc.c')
-                for half in halves
-            ]
+            c_halves = [half.inc_c_path for half in halves]
 
             yield DungeonPauseMapPage(
                 floor=floor,
@@ -134,7 +130,9 @@ class DungeonPauseMap:
 
 
     @cached_property
+    @yield_list
     def diffs(self):
+        map_data = self.scene_map.map_data
 
         # Install our finished pause map textures into the OOT
         # assets directory.
@@ -163,7 +161,7 @@ class DungeonPauseMap:
             )
 
         # Instead of letting ZAPD convert our PNGs to .inc.c files, we do
-        # it ourselves; see comment in dungeon_map_image_to_c.
+        # it ourselves; see comment in render_all.
         map_48x85_static_includes = [
             x.replace('.png', '.inc.c')
             for x in map_48x85_static_pngs
@@ -187,6 +185,10 @@ class DungeonPauseMap:
             from_path=self.title_image.render_path,
             to_path=title_path
         )
+        yield z64c.InstallFile(
+            from_path=self.title_image.inc_c_path,
+            to_path='build/' + title_path.replace('.png', '.inc.c')
+        )
 
         # Update the title asset file to reference our new title image.
         # Keep the decomp scene names; saves us having to update the array in z_kaleido_map_PAL.c
@@ -203,40 +205,15 @@ class DungeonPauseMap:
             first_index=self.scene.index
         )
 
-        # There's no explicit "number of floors" array; figure it out
-        # from the texture index offsets
-        sFloorTexIndexOffset = z64c.read_array(
-            app.scene.oot_dir,
-            'src/code/z_map_data.c',
-            'sFloorTexIndexOffset'
-        )
-        num_floors = [
-            9 - xs.count(0)
-            for xs in sFloorTexIndexOffset
-        ]
-
         # Write our offsets.
         # This is how OOT knows which range of textures in the asset
-        # file corresponds to our scene. We need to rewrite the whole
-        # base array because we might have moved other scenes' data
-        # around.
-        old_num_floors = num_floors[self.scene.index]
-        old_tex_index_offset = 2 * sum(num_floors[:self.scene.index])
-
-        num_floors[self.scene.index] = len(self.pages)
-        yield z64c.CArray(
-            'src/code/z_map_data.c',
-            'sDgnTexIndexBase',
-            [
-                2 * sum(num_floors[:i])
-                for i in range(10)
-            ]
-        )
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        # file corresponds to our scene. Setting them also rewrites
+        # sDgnTexIndexBase, because we might have moved other scenes'
+        # data around.
+        map_data.set(
             'sFloorTexIndexOffset',
             self.scene.index,
-            pad_front([2 * i for i in range(len(self.pages))], 8, 0)
+            [2 * i for i in range(len(self.pages))]
         )
 
         # Update the main asset file to include our generated .inc.c files.
@@ -249,19 +226,17 @@ class DungeonPauseMap:
                 for side in ['Left', 'Right']
             ],
             includes=map_48x85_static_includes,
-            first_index=2 * sum(num_floors[x] for x in range(self.scene.index))
+            first_index=map_data['sDgnTexIndexBase'][self.scene.index]
         )
 
 
         # Skull icon indicating boss floor
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sBossFloor',
             self.scene.index,
             self.boss_floor
         )
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sSkullFloorIconY',
             self.scene.index,
             51 - 14 * self.boss_floor
@@ -273,19 +248,13 @@ class DungeonPauseMap:
                 return f'F_{height + 1}F'
             return f'F_B{-height}'
 
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sFloorID',
             self.scene.index,
-            pad_front(
-                [
-                    floor_id(i - self.num_basement_floors)
-                    for i in reversed(range(len(self.pages)))
-                ],
-                8,
-                0
-            ),
-            format_hint='floor_ids'
+            [
+                floor_id(i - self.num_basement_floors)
+                for i in reversed(range(len(self.pages)))
+            ]
         )
 
         # Just the number of rooms on each floor.
@@ -293,16 +262,14 @@ class DungeonPauseMap:
             len(floor.rooms)
             for floor in self.scene.floors
         )
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sMaxPaletteCount',
             self.scene.index,
             max_palette_count
         )
 
         # Room palette indices.
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sRoomPalette',
             self.scene.index,
             [
@@ -312,8 +279,7 @@ class DungeonPauseMap:
         )
 
         # Just a list of used palette indices on each floor.
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sPaletteRoom',
             self.scene.index,
             [
@@ -370,13 +336,7 @@ class DungeonPauseMap:
 
             floor_marks.append(['PAUSE_MAP_MARK_NONE', 0, 'NULL', 0, 0, [0]])
 
-        yield z64c.CArrayRange(
-            'src/overlays/misc/ovl_kaleido_scope/z_lmap_mark_data.c',
-            'gPauseMapMarkDataTable',
-            old_tex_index_offset // 2,
-            old_num_floors,
-            map_marks
-        )
+        map_data.set_pause_map_marks(self.scene.index, map_marks)
 
 
     @cached_property
@@ -389,7 +349,21 @@ class DungeonPauseMap:
 
     def render_all(self):
         log("Render PAUSE MAP title")
-        text.render_text(self.scene.display_name, (96, 16), self.title_image.render_path)
+
+        def render_title():
+            text.render_text(self.scene.display_name, (96, 16), self.title_image.render_path)
+            z64tex.convert(
+                self.title_image.render_path,
+                self.title_image.inc_c_path,
+                'ia8'
+            )
+
+        self.scene_map.render_cache.get(
+            self.title_image.name,
+            [self.title_image.render_path, self.title_image.inc_c_path],
+            render_cache.key_of('pause map title', self.scene.display_name, (96, 16)),
+            render_title
+        )
         
         log("Render PAUSE MAP cameras")
 
@@ -451,8 +425,6 @@ class DungeonPauseMap:
         for floor in self.scene.floors:
             assert len(floor.rooms) == len(set(room_palettes[x] for x in floor.rooms))
 
-        sz = (w, h) = (96, 85)
-
         # Render all the room maps and combine them by floor
 
         for page in self.pages:
@@ -460,70 +432,31 @@ class DungeonPauseMap:
             for layer in page.layers:
                 self.scene_map.render_map_camera(layer.camera)
 
-            floor_map = PIL.Image.new('P', sz)
-            floor_map.putpalette(image_utils.ci4_palette)
-
-            for layer in page.layers:
-                room = layer.layer.room
-                room_palette_index = room_palettes[room]
-
-                room_image = PIL.Image.open(layer.camera.image.render_path)
-                room_alpha = room_image.split()[-1]
-
-                for y in range(h):
-                    for x in range(w):
-                        if room_alpha.getpixel((x, y)):
-                            floor_map.putpixel((x, y), room_palette_index)
-
-
-            image_utils.fast_outline(floor_map, 15)
-
-            floor_map.save(page.image.render_path)
-
-            half = floor_map.crop((0, 0, 48, 85))
-            half.save(page.halves[0].render_path)
-
-            half = floor_map.crop((48, 0, 96, 85))
-            half.save(page.halves[1].render_path)
-
-            for i in [0, 1]:
-                dungeon_map_image_to_c(page.halves[i].render_path, page.c_halves[i])
-
-
+            layers = [
+                (layer.camera.image.render_path, room_palettes[layer.layer.room])
+                for layer in page.layers
+            ]
+            self.scene_map.render_cache.get(
+                page.image.name,
+                [
+                    page.image.render_path,
+                    *[half.render_path for half in page.halves],
+                    *page.c_halves,
+                ],
+                render_cache.key_of(
+                    'pause map floor',
+                    minimap_images.compose_floor_version,
+                    [(file_hash(path), palette) for path, palette in layers]
+                ),
+                lambda: minimap_images.compose_floor(
+                    layers,
+                    page.image.render_path,
+                    [half.render_path for half in page.halves],
+                    page.c_halves
+                )
+            )
 
-def dungeon_map_image_to_c(image_path, c_path):
-    # I haven't had any luck getting ZAPD to convert dungeon
-    # map PNGs into the right format.  Our map processor
-    # writes out ci4 PNGs, and OOT wants raw ci4 data.  But if
-    # you feed ZAPD a ci4 PNG, it just seems to make a mess of
-    # it?  ZAPD extracts vanilla ci4 textures as ci8 PNGs, so
-    # maybe those would work... PIL documents a "bits" flag to save() that lets you
-    # specify ci8, but it doesn't work. And converting PNGs
-    # with ImageMagick with "png8:filename" doesn't preserve
-    # colour indices.
-    #
-    # Let's just write our own god damn file.
-    image = PIL.Image.open(image_path)
-    
-    with open(c_path, 'wt') as f:
-        i = 0
-        addr = 0
-        for y in range(85):
-            for x in range(48):
-                if i % 64 == 0:
-                    f.write('    ')
-                if i % 16 == 0:
-                    f.write('0x')
-                f.write('0123456789ABCDEF'[image.getpixel((x, y))])
-                i += 1
-                if i % 16 == 0:
-                    f.write(', ')
-
-                if i % 64 == 0:
-                    f.write(' // 0x%06X\n' % addr)
-                    addr += 32
 
-    
 def get_world_to_96x85_dungeon_map_transform(cam_pos, cam_scale_x):
     cam_scale_y = cam_scale_x * 85/96
     cam_scale = Vec2(cam_scale_x, cam_scale_y)
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 
 dirs4 = [(-1,0),(1,0),(0,-1),(0,1)]
 dirs8 = dirs4 + [(-1,-1),(-1,1),(1,-1),(1,1)]
@@ -33,13 +36,41 @@ def get(image, co, default):
     return image.getpixel(co)
 
 
-def fast_outline(image, outline_color):
-    """outline_color must not already exist in image."""
-    for y in range(image.height):
-        for x in range(image.width):
-            if get(image, (x, y), 0) == 0:
-                if any(
-                    get(image, (x+dx, y+dy), 0) not in [0, outline_color]
-                    for (dx, dy) in dirs8
-                ):
-                    image.putpixel((x, y), outline_color)
+def neighbours_any(mask, dirs):
+    """
+    For each pixel, whether mask is set at any of the given offsets from
+    it. Pixels off the edge count as unset. Like calling get() in a loop
+    over dirs for every pixel, but done with shifted views of the array.
+    """
+    h, w = mask.shape
+    r = max(max(abs(dx), abs(dy)) for (dx, dy) in dirs)
+    padded = np.zeros((h + 2*r, w + 2*r), dtype=bool)
+    padded[r:r+h, r:r+w] = mask
+
+    result = np.zeros((h, w), dtype=bool)
+    for (dx, dy) in dirs:
+        result |= padded[r+dy:r+dy+h, r+dx:r+dx+w]
+    return result
+
+
+def shifted(pixels, shift_x, shift_y, fill=0):
+    """
+    pixels moved right by shift_x and down by shift_y, filling the
+    uncovered edges with fill. Same as an integer AFFINE transform.
+    """
+    h, w = pixels.shape[:2]
+    out = np.full_like(pixels, fill)
+    if abs(shift_x) >= w or abs(shift_y) >= h:
+        return out
+    out[max(0, shift_y):h + min(0, shift_y), max(0, shift_x):w + min(0, shift_x)] = \
+        pixels[max(0, -shift_y):h - max(0, shift_y), max(0, -shift_x):w - max(0, shift_x)]
+    return out
+
+
+def outline_mask(pixels, outline_color):
+    """
+    Empty pixels next to anything but outline_color, which are the ones
+    to colour to outline everything in a single-band image.
+    """
+    filled = (pixels != 0) & (pixels != outline_color)
+    return (pixels == 0) & neighbours_any(filled, dirs8)
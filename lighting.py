@@ -1,53 +1,196 @@
-import bpy
-import random
-from .utils import *
-
+from dataclasses import dataclass
 
-def color_mul(a, b):
-    return tuple([
-        a[i] * b[i]
-        for i in range(4)
-    ])
+import bpy
+import re
 
+import numpy as np
 
-def color_add(dest, a, b):
-    for i in range(3):
-        dest[i] = a[i] + b[i]
+from . import render_cache
+from .utils import *
 
 
 def merge_vertex_colors(scene):
+    merged = skipped = 0
     for obj in bpy.data.objects:
+        # Split room geometry is rebuilt from Geom every time, so it
+        # would never be skipped; it gets Geom's colours when it's
+        # split again instead.
+        if 'ExpGen' in obj.name:
+            continue
         if obj.type == 'MESH':
-            if obj.data.color_attributes.get('Multiply'):
-                merge_vertex_colors_for_object(obj)
+            mesh = obj.data
+            if mesh.rgaColorStack or mesh.color_attributes.get('Multiply'):
+                if merge_vertex_colors_for_object(obj):
+                    merged += 1
+                else:
+                    skipped += 1
+    log(f"Merged vertex colours on {merged} objects, {skipped} unchanged")
+
+
+# Bump this when changing how colours are merged, so every object gets
+# merged again.
+merge_version = 2
+
+
+# What Col is made of when a mesh doesn't say otherwise
+default_stack = 'AO multiply, Multiply multiply'
+
+
+@dataclass
+class StackStep:
+    mode: str
+    layer: str = None
+    mask: str = None
+
+
+# How many colour attributes each mode takes: the layer, and a mask
+stack_modes = {
+    'multiply': 1,
+    'add': 1,
+    'screen': 1,
+    'lerp': 2,
+    'clamp': 0,
+}
+
+
+def parse_stack(text):
+    '''
+    A colour stack is a list of steps separated by commas or newlines,
+    applied in order starting from white:
+
+        AO multiply, Bounce add, Tint lerp TintMask, clamp
+
+    multiply, add and screen blend a colour attribute in. lerp mixes
+    towards one by the red channel of a mask attribute. clamp clamps to
+    0-1. add and screen leave alpha alone.
+    '''
+    steps = []
+    for part in re.split(r'[,\n]', text or default_stack):
+        words = part.split()
+        if not words:
+            continue
+
+        if words[0] in stack_modes:
+            mode, args = words[0], words[1:]
+        elif len(words) >= 2:
+            mode, args = words[1], [words[0]] + words[2:]
+        else:
+            raise Exception(f"Can't read colour stack step {part.strip()!r}")
+
+        if stack_modes.get(mode) != len(args):
+            raise Exception(f"Can't read colour stack step {part.strip()!r}")
+        steps.append(StackStep(mode, *args))
+    return steps
+
+
+def evaluate_stack(steps, layers, n):
+    '''
+    Run a colour stack over n colours. layers maps attribute names to
+    (n, 4) arrays.
+    '''
+    col = np.ones((n, 4), dtype=np.float32)
+    for step in steps:
+        layer = layers.get(step.layer)
+        if step.mode == 'multiply':
+            col *= layer
+        elif step.mode == 'add':
+            col[:, :3] += layer[:, :3]
+        elif step.mode == 'screen':
+            col[:, :3] = 1 - (1 - col[:, :3]) * (1 - layer[:, :3])
+        elif step.mode == 'lerp':
+            mask = layers[step.mask][:, :1]
+            col += (layer - col) * mask
+        elif step.mode == 'clamp':
+            np.clip(col, 0, 1, out=col)
+    return col
 
 
 def merge_vertex_colors_for_object(geom_obj):
+    '''
+    Work out Col from the mesh's colour stack; by default AO x Multiply.
+    Returns False if nothing had changed since the last merge, so it was
+    skipped.
+    '''
     mesh = geom_obj.data
+    steps = parse_stack(mesh.rgaColorStack)
 
     layer_col = mesh.color_attributes['Col']
-    layer_ao = mesh.color_attributes['AO']
-    layer_mul = mesh.color_attributes['Multiply']
+    col = read_colors(layer_col)
 
-    log('col', len(layer_col.data))
-    log('ao', len(layer_ao.data))
-    log('mul', len(layer_mul.data))
+    # One colour per loop (or vertex), as far as Col goes. Where a layer
+    # is shorter, the rest counts as white, or black for add and screen.
+    n = min(domain_size(mesh, layer_col.domain), len(col))
 
-    i = 0
-    for poly in mesh.polygons:
-        for idx in poly.loop_indices:
-            if i < len(layer_col.data):
+    layers = {}
+    for step in steps:
+        for name in [step.layer, step.mask]:
+            if name is None or name in layers:
+                continue
+            attr = mesh.color_attributes.get(name)
+            if not attr:
+                raise Exception(f"{mesh.name} has no colour attribute {name} for its colour stack")
+            log(name, len(attr.data))
 
-                if i < len(layer_mul.data):
-                    mul = layer_mul.data[i].color
-                else:
-                    mul = (1, 1, 1, 1)
+            fill = 0 if step.mode in ['add', 'screen'] else 1
+            layers[name] = padded(
+                colors_in_domain(mesh, attr, layer_col.domain), n, fill
+            )
 
-                if i < len(layer_ao.data):
-                    ao = layer_ao.data[i].color
-                else:
-                    ao = (1, 1, 1, 1)
+    # Col is derived, so if the stack, its layers and Col itself are
+    # what they were straight after the last merge, there's nothing to
+    # do.
+    if mesh.get('MergedColorsKey') == merge_key(layer_col, steps, layers, col):
+        return False
+
+    col[:n] = evaluate_stack(steps, layers, n)
+    write_colors(layer_col, col)
+
+    # Read back, since byte colours don't keep the exact floats written
+    mesh['MergedColorsKey'] = merge_key(layer_col, steps, layers, read_colors(layer_col))
+    return True
+
+
+def merge_key(layer_col, steps, layers, col):
+    return render_cache.key_of(
+        merge_version,
+        layer_col.domain,
+        steps,
+        *[part for name in sorted(layers) for part in [name, layers[name]]],
+        col
+    )
+
+
+def domain_size(mesh, domain):
+    return len(mesh.vertices) if domain == 'POINT' else len(mesh.loops)
+
+
+def colors_in_domain(mesh, attr, domain):
+    '''
+    attr's colours per vertex (POINT) or per loop (CORNER). Corners take
+    their vertex's colour, and vertices the average of their corners,
+    like Blender does when converting attributes.
+    '''
+    colors = read_colors(attr)
+    if attr.domain == domain:
+        return colors
+
+    loop_verts = read_array(mesh.loops, 'vertex_index', np.int32)
+    if domain == 'CORNER':
+        return padded(colors, len(mesh.vertices))[loop_verts]
+
+    colors = padded(colors, len(mesh.loops))
+    sums = np.zeros((len(mesh.vertices), 4), dtype=np.float64)
+    np.add.at(sums, loop_verts, colors)
+    counts = np.bincount(loop_verts, minlength=len(mesh.vertices))[:, None]
+    return np.where(
+        counts > 0,
+        sums / np.maximum(counts, 1),
+        1
+    ).astype(np.float32)
 
-                layer_col.data[i].color = color_mul(mul, ao)
 
-            i += 1
+def padded(colors, n, fill=1):
+    '''The first n colours, padded with fill (white by default).'''
+    result = np.full((n, 4), fill, dtype=np.float32)
+    result[:min(n, len(colors))] = colors[:n]
+    return result
@@ -0,0 +1,150 @@
+'''
+Save the diffs from an install so they can be installed again later
+without Blender.
+
+A manifest is a JSON file listing the diffs. Files to install are copied
+into an artifacts directory next to the manifest, named by their SHA-1,
+so the manifest doesn't depend on anything in the decomp's build
+directory and re-renders of identical images don't pile up.
+
+To reinstall after a git checkout or git clean in the decomp:
+
+    python -m oot_scene_tool.manifest path/to/scene.json path/to/oot
+
+This module doesn't need bpy.
+'''
+import argparse
+import dataclasses
+import json
+import os
+import shutil
+
+from . import z64c
+from .common_utils import *
+
+
+version = 1
+
+diff_types = {
+    cls.__name__: cls
+    for cls in [
+        z64c.CArray,
+        z64c.CArrayItem,
+        z64c.CArrayRange,
+        z64c.ReplaceIncludes,
+    ]
+}
+
+
+def artifacts_dir(manifest_path):
+    return os.path.join(os.path.dirname(os.path.abspath(manifest_path)), 'artifacts')
+
+
+def encode_value(value):
+    # Values read from C remember how they were written. JSON would turn
+    # them into plain numbers, so store the C text instead; to_c writes
+    # strings out verbatim.
+    if isinstance(value, list):
+        return [encode_value(x) for x in value]
+    if isinstance(value, (z64c.CInt, z64c.CFloat)):
+        return value.text
+    if isinstance(value, float):
+        return z64c.to_c(value)
+    return value
+
+
+def encode_diff(diff, artifacts):
+    if isinstance(diff, z64c.InstallFile):
+        h = file_hash(diff.from_path)
+        if h is None:
+            raise Exception(f"Can't find {diff.from_path} to save in manifest")
+
+        _, ext = os.path.splitext(diff.from_path)
+        artifact = f'{h}{ext}'
+        artifact_path = os.path.join(artifacts, artifact)
+        if not os.path.exists(artifact_path):
+            with atomic_write(artifact_path, 'wb') as f:
+                with open(diff.from_path, 'rb') as from_f:
+                    shutil.copyfileobj(from_f, f)
+
+        return {
+            'type': 'InstallFile',
+            'artifact': artifact,
+            'to_path': diff.to_path,
+        }
+
+    if type(diff).__name__ not in diff_types:
+        raise Exception(f"Can't save {diff!r} in manifest")
+
+    fields = {
+        field.name: getattr(diff, field.name)
+        for field in dataclasses.fields(diff)
+    }
+    if 'value' in fields:
+        fields['value'] = encode_value(fields['value'])
+    return {'type': type(diff).__name__, **fields}
+
+
+def decode_diff(entry, artifacts):
+    entry = dict(entry)
+    kind = entry.pop('type')
+    if kind == 'InstallFile':
+        return z64c.InstallFile(
+            from_path=os.path.join(artifacts, entry['artifact']),
+            to_path=entry['to_path']
+        )
+    if kind not in diff_types:
+        raise Exception(f"Unknown diff type in manifest: {kind}")
+    return diff_types[kind](**entry)
+
+
+def save(path, diffs):
+    '''Write diffs to a manifest at path. Returns the diffs, for chaining.'''
+    diffs = list(diffs)
+    artifacts = artifacts_dir(path)
+    os.makedirs(artifacts, exist_ok=True)
+
+    manifest = {
+        'version': version,
+        'diffs': [encode_diff(diff, artifacts) for diff in diffs],
+    }
+    with atomic_write(path, 'wt') as f:
+        json.dump(manifest, f, separators=(',', ':'))
+
+    log(f"Saved {len(diffs)} diffs to {path}")
+    return diffs
+
+
+@yield_list
+def load(path):
+    with open(path, 'rt') as f:
+        manifest = json.load(f)
+
+    if manifest.get('version') != version:
+        raise Exception(
+            f"{path} is manifest version {manifest.get('version')}; "
+            f"this tool reads version {version}"
+        )
+
+    artifacts = artifacts_dir(path)
+    for entry in manifest['diffs']:
+        yield decode_diff(entry, artifacts)
+
+
+def install(path, oot):
+    return z64c.install_diffs(oot, load(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reinstall a saved map install into the decomp."
+    )
+    parser.add_argument('manifest', help="Manifest JSON saved by Render Maps")
+    parser.add_argument('oot', help="Decomp directory")
+    args = parser.parse_args()
+
+    install(args.manifest, args.oot)
+
+
+if __name__ == '__main__':
+    main()
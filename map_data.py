@@ -0,0 +1,215 @@
+from dataclasses import dataclass
+
+from . import z64c
+from .common_utils import *
+
+
+NUM_DUNGEONS = 10
+NUM_OVERWORLDS = 24
+
+# Dungeons can have at most this many pause-map floors.
+MAX_FLOORS = 8
+
+z_map_data_c = 'src/code/z_map_data.c'
+z_map_mark_data_c = 'src/overlays/misc/ovl_map_mark_data/z_map_mark_data.c'
+z_lmap_mark_data_c = 'src/overlays/misc/ovl_kaleido_scope/z_lmap_mark_data.c'
+
+
+@dataclass
+class MapTable:
+    '''
+    A per-scene table in z_map_data.c. Row i belongs to dungeon i or
+    overworld scene i, depending on num_rows.
+
+    If width is set, rows are lists padded out to that length with
+    pad_value, at the front or back depending on pad.
+
+    If sums is set, this table is derived from another one: row i is the
+    sum of term(row) over the first i rows of the `sums` table.
+    '''
+    decl: str
+    num_rows: int
+    width: int = None
+    pad: str = 'front'
+    pad_value: object = 0
+    format_hint: str = ''
+    sums: str = None
+    term: object = None
+    format: object = None
+
+
+def num_floors(floor_tex_index_offset_row):
+    # There's no explicit "number of floors" array; figure it out
+    # from the texture index offsets, e.g. { 0, 0, 0, 0, 0, 0, 2, 4 }
+    # is three floors. The first floor's offset is also zero, hence + 1.
+    return MAX_FLOORS + 1 - list(floor_tex_index_offset_row).count(0)
+
+
+tables = [
+    # Dungeons
+    MapTable('sFloorCoordY', NUM_DUNGEONS, width=MAX_FLOORS, pad_value=9999.0),
+    MapTable('sFloorTexIndexOffset', NUM_DUNGEONS, width=MAX_FLOORS),
+    MapTable('sFloorID', NUM_DUNGEONS, width=MAX_FLOORS, format_hint='floor_ids'),
+    MapTable('sBossFloor', NUM_DUNGEONS),
+    MapTable('sSkullFloorIconY', NUM_DUNGEONS),
+    MapTable('sMaxPaletteCount', NUM_DUNGEONS),
+    MapTable('sRoomPalette', NUM_DUNGEONS),
+    MapTable('sPaletteRoom', NUM_DUNGEONS),
+    MapTable('sDgnMinimapCount', NUM_DUNGEONS),
+    MapTable('sRoomCompassOffsetX', NUM_DUNGEONS),
+    MapTable('sRoomCompassOffsetY', NUM_DUNGEONS),
+    MapTable('sDgnCompassInfo', NUM_DUNGEONS),
+    MapTable('sSwitchEntryCount', NUM_DUNGEONS),
+    MapTable('sSwitchFromRoom', NUM_DUNGEONS),
+    MapTable('sSwitchFromFloor', NUM_DUNGEONS),
+    MapTable('sSwitchToRoom', NUM_DUNGEONS),
+
+    # Index of each dungeon's first minimap texture in map_i_static.
+    MapTable(
+        'sDgnMinimapTexIndexOffset', NUM_DUNGEONS,
+        sums='sDgnMinimapCount',
+        term=lambda count: count
+    ),
+
+    # Index of each dungeon's first pause map texture in
+    # map_48x85_static. There are two textures (left and right) per
+    # floor.
+    MapTable(
+        'sDgnTexIndexBase', NUM_DUNGEONS,
+        sums='sFloorTexIndexOffset',
+        term=lambda row: 2 * num_floors(row)
+    ),
+
+    # Overworld scenes
+    MapTable('sOwMinimapTexSize', NUM_OVERWORLDS),
+    MapTable('sOwMinimapWidth', NUM_OVERWORLDS),
+    MapTable('sOwMinimapHeight', NUM_OVERWORLDS),
+    MapTable('sOwMinimapPosX', NUM_OVERWORLDS),
+    MapTable('sOwMinimapPosY', NUM_OVERWORLDS),
+    MapTable('sOwEntranceIconPosX', NUM_OVERWORLDS),
+    MapTable('sOwEntranceIconPosY', NUM_OVERWORLDS),
+    MapTable('sOwEntranceFlag', NUM_OVERWORLDS),
+    MapTable('sOwCompassInfo', NUM_OVERWORLDS),
+
+    # Byte offset of each overworld minimap in map_grand_static.
+    MapTable(
+        'sOwMinimapTexOffset', NUM_OVERWORLDS,
+        sums='sOwMinimapTexSize',
+        term=lambda size: size,
+        format=lambda x: z64c.CInt('0x%04X' % x)
+    ),
+]
+
+tables_by_decl = {table.decl: table for table in tables}
+
+
+class MapData:
+    '''
+    The per-scene map tables of z_map_data.c, plus the map mark tables in
+    z_map_mark_data.c and z_lmap_mark_data.c, as one in-memory model.
+
+    Tables are read from the decomp the first time they're needed. Rows
+    are changed with set(), which also updates any derived tables, and
+    diffs() returns patches for just the rows that actually changed.
+
+        map_data = MapData(oot)
+        map_data.set('sDgnMinimapCount', 3, 7)
+        map_data['sDgnMinimapTexIndexOffset'][4]  # Updated to match
+        z64c.install_diffs(oot, map_data.diffs())
+    '''
+    def __init__(self, oot):
+        self.oot = oot
+        self.rows = {}
+        self.changed = {}
+        self.mark_diffs = []
+
+    def __getitem__(self, decl):
+        '''All rows of a table. Use set() to change them.'''
+        if decl not in self.rows:
+            self.rows[decl] = z64c.read_array(self.oot, z_map_data_c, decl)
+            self.changed[decl] = set()
+        return self.rows[decl]
+
+    def set(self, decl, index, value):
+        table = tables_by_decl[decl]
+        if table.sums:
+            raise Exception(f"{decl} is derived from {table.sums}; set that instead")
+
+        if table.width is not None:
+            pad = pad_front if table.pad == 'front' else pad_back
+            value = pad(list(value), table.width, table.pad_value)
+            if len(value) > table.width:
+                raise Exception(f"{decl}[{index}] can only have {table.width} items")
+
+        self.set_row(decl, index, value)
+
+        for derived in tables:
+            if derived.sums == decl:
+                self.update_derived(derived, index)
+
+    def set_row(self, decl, index, value):
+        rows = self[decl]
+        if rows[index] != value:
+            rows[index] = value
+            self.changed[decl].add(index)
+
+    def update_derived(self, table, changed_index):
+        '''
+        Recalculate the rows of a derived table from changed_index
+        onwards. Only later rows depend on the changed source row, but
+        redoing this one too fixes it up if the file was inconsistent.
+        '''
+        source = self[table.sums]
+        total = sum(table.term(row) for row in source[:changed_index])
+        for i in range(changed_index, table.num_rows):
+            value = table.format(total) if table.format else total
+            self.set_row(table.decl, i, value)
+            if i < len(source):
+                total += table.term(source[i])
+
+    def set_map_marks(self, dungeon_index, marks):
+        '''
+        Replace a dungeon's minimap marks. gMapMarkDataTable points to a
+        separate array for each dungeon.
+        '''
+        gMapMarkDataTable = z64c.read_array(
+            self.oot,
+            z_map_mark_data_c,
+            'gMapMarkDataTable'
+        )
+        self.mark_diffs.append(z64c.CArray(
+            z_map_mark_data_c,
+            gMapMarkDataTable[dungeon_index],
+            marks
+        ))
+
+    def set_pause_map_marks(self, dungeon_index, floor_marks):
+        '''
+        Replace a dungeon's pause map marks, one entry per floor.
+        gPauseMapMarkDataTable is a flat list of every dungeon's floors,
+        so we replace the range of floors the dungeon had when we loaded
+        it, which may be a different length from the new one.
+        '''
+        loaded = z64c.read_array(self.oot, z_map_data_c, 'sFloorTexIndexOffset')
+        first_floor = sum(num_floors(row) for row in loaded[:dungeon_index])
+        self.mark_diffs.append(z64c.CArrayRange(
+            z_lmap_mark_data_c,
+            'gPauseMapMarkDataTable',
+            first_floor,
+            num_floors(loaded[dungeon_index]),
+            floor_marks
+        ))
+
+    @yield_list
+    def diffs(self):
+        for table in tables:
+            for index in sorted(self.changed.get(table.decl, ())):
+                yield z64c.CArrayItem(
+                    z_map_data_c,
+                    table.decl,
+                    index,
+                    self.rows[table.decl][index],
+                    format_hint=table.format_hint
+                )
+
+        yield from self.mark_diffs
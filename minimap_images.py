@@ -0,0 +1,250 @@
+'''
+Turn raw map renders into the stylized minimap and pause map images the
+game draws.
+
+Doesn't need bpy, so these can be tested outside Blender; see
+tests/test_minimap_images.py.
+'''
+import numpy as np
+import PIL.Image
+import PIL.ImageDraw
+import PIL.ImageFilter
+
+from . import image_utils
+from . import z64tex
+from .common_utils import *
+
+
+# Bump this when changing process_dungeon_minimap, so cached minimaps get remade.
+dungeon_minimap_version = 1
+
+
+def process_dungeon_minimap(raw_path, processed_path):
+    """
+    Take a raw camera render and turn it into a stylized
+    map for use in the game.
+
+    This is only for dungeon minimaps; overworld minimaps
+    are different enough that they have their own function.
+    """
+    raw_rgba = PIL.Image.open(raw_path)
+    raw = np.asarray(raw_rgba.convert('RGBA'))
+    raw_void = raw[:, :, 0]
+    raw_surface = raw[:, :, 1]
+    raw_alpha = raw[:, :, 3]
+
+    h, w = raw_alpha.shape
+    dirs8 = image_utils.dirs8
+
+    # Fill and outline. Empty pixels next to geometry are outline; void
+    # pixels are outlined where they touch a surface.
+    outline = (raw_alpha == 0) & image_utils.neighbours_any(raw_alpha != 0, dirs8)
+    void = (raw_alpha != 0) & (raw_void > 128)
+    void_edge = void & image_utils.neighbours_any(raw_surface >= 128, dirs8)
+
+    out = np.zeros((h, w), dtype=np.uint8)
+    out[(raw_alpha != 0) & ~void] = 4
+    out[outline | void_edge] = 15
+
+    # Find bounds
+    ys, xs = np.nonzero(outline)
+
+    shift = (0, 0)
+
+    if len(xs) == 0:
+        # Empty image
+        out_image = PIL.Image.fromarray(out * 16)
+
+    else:
+        bounds = Rect.bounding_points(
+            Vec2(int(xs.min()), int(ys.min())),
+            Vec2(int(xs.max()), int(ys.max()))
+        )
+
+        bounds = bounds.expand(5)
+
+        bounds.size.x -= 1
+        bounds.size.y -= 1
+
+        # Draw border
+        out_image = PIL.Image.fromarray(out)
+        draw = PIL.ImageDraw.Draw(out_image)
+        draw.rectangle(
+            ((bounds.min.x, bounds.min.y),
+                (bounds.max.x, bounds.max.y)),
+            outline=15
+        )
+        out = np.asarray(out_image)
+
+        # Blur
+        halo = np.where(
+            (raw_alpha != 0)
+            | (out != 0)
+            | image_utils.neighbours_any(raw_alpha != 0, image_utils.dirs4),
+            0xb0,
+            0
+        ).astype(np.uint8)
+
+        halo = PIL.Image.fromarray(halo)
+        draw = PIL.ImageDraw.Draw(halo)
+        draw.rectangle(
+            ((bounds.min.x, bounds.min.y),
+                (bounds.max.x, bounds.max.y)),
+            outline=0x10
+        )
+        halo = np.array(halo.filter(PIL.ImageFilter.GaussianBlur(1)))
+
+        # Composite out_image onto its halo
+        drawn = (out != 0) | (raw_alpha != 0)
+        halo[drawn] = out[drawn] * 16
+
+        # Shift to lower-right
+        shift_x = w - 2 - bounds.max.x
+        shift_y = h - 2 - bounds.max.y
+
+        shift = (shift_x, shift_y)
+
+        out_image = PIL.Image.fromarray(
+            image_utils.shifted(halo, shift_x, shift_y)
+        )
+
+    # ZAPD doesn't like grayscale PNGs
+    out_image = out_image.convert('RGB')
+    out_image.save(processed_path)
+
+    return shift
+
+
+# Bump this when changing process_overworld_minimap, so cached minimaps get remade.
+overworld_minimap_version = 1
+
+
+def process_overworld_minimap(layer_colors, layer_paths, processed_path):
+    """
+    Take a raw camera render and turn it into a stylized
+    map for use in the game.
+
+    This is only for overworld minimaps; dungeon minimaps
+    are different enough that they have their own function.
+    """
+    layer_images = [PIL.Image.open(x) for x in layer_paths]
+    layer_masks = [np.asarray(x.split()[3]) for x in layer_images]
+    w, h = layer_images[0].size
+
+    pix_wall = image_utils.ia4(7, 1)
+    pix_ground = image_utils.ia4(3, 1)
+    pix_outline = image_utils.ia4(0, 1)
+    pix_oob = image_utils.ia4(0, 0)
+
+    # Compose layers to 'composed'. Later layers go on top.
+    composed = np.zeros((h, w), dtype=np.uint8)
+    for layer_color, layer_alpha in zip(layer_colors, layer_masks):
+        composed[layer_alpha != 0] = image_utils.ia4(layer_color, 1)
+
+    # Copy 'composed' to 'out' and add first outline
+    out = composed.copy()
+    out[(composed == 0) & image_utils.neighbours_any(composed != 0, image_utils.dirs8)] = pix_wall
+
+    # Second outline with boxy shadow
+    shadow_dirs = image_utils.dirs8 + [
+        (-2, 0), (-2, 1), (-2, -1),
+        (0, -2), (1, -2), (-1, -2)
+    ]
+    casts_shadow = (out == pix_wall) | (out == pix_ground)
+    out[(out == pix_oob) & image_utils.neighbours_any(casts_shadow, shadow_dirs)] = pix_outline
+
+    out_image = PIL.Image.fromarray(out).convert('P')
+    out_image.putpalette(image_utils.ia4_palette, 'RGBA')
+
+    # Find bounds
+    ys, xs = np.nonzero(out != pix_oob)
+
+    if len(xs) == 0:
+        # Empty image
+        shift = (0, 0)
+
+    else:
+        bounds = Rect.bounding_points(
+            Vec2(int(xs.min()), int(ys.min())),
+            Vec2(int(xs.max()), int(ys.max()))
+        )
+
+        # All maps have widths as a multiple of 16. Probably required
+        # for alignment, so let's do it.
+        x_error = bounds.size.x % 16
+        if x_error:
+            x_error = 16 - x_error
+            xl = x_error // 2
+            xr = x_error - xl
+            bounds.origin.x -= xl
+            bounds.size.x += xl + xr
+
+        assert bounds.size.x % 16 == 0
+        assert 0 <= bounds.size.x <= 96
+
+
+        print('crop to', bounds)
+        out_image = out_image.crop((
+            bounds.min.x, bounds.min.y, bounds.max.x, bounds.max.y
+        ))
+
+        shift = (
+            96 - bounds.max.x,
+            85 - bounds.max.y
+        )
+        print('shift is', shift)
+
+    out_image = out_image.convert('RGBA')
+    out_image.save(processed_path)
+
+    return out_image.size, shift
+
+
+# Bump this when changing compose_floor, so cached floors get remade.
+compose_floor_version = 1
+
+
+def compose_floor(layers, floor_path, half_paths, c_half_paths):
+    """
+    Combine room renders into a floor of the pause map, given as
+    (render path, palette index) pairs, and split it into the left and
+    right halves the game draws.
+    """
+    w, h = 96, 85
+
+    # Palette index of each pixel. Later layers go on top.
+    floor_map = np.zeros((h, w), dtype=np.uint8)
+
+    for render_path, room_palette_index in layers:
+        room_image = PIL.Image.open(render_path)
+        room_alpha = np.asarray(room_image.split()[-1])
+
+        floor_map[room_alpha != 0] = room_palette_index
+
+    floor_map[image_utils.outline_mask(floor_map, 15)] = 15
+
+    halves = [floor_map[:, :48], floor_map[:, 48:]]
+
+    save_ci4_png(floor_map, floor_path)
+    for half, path in zip(halves, half_paths):
+        save_ci4_png(half, path)
+
+    # I haven't had any luck getting ZAPD to convert dungeon
+    # map PNGs into the right format.  Our map processor
+    # writes out ci4 PNGs, and OOT wants raw ci4 data.  But if
+    # you feed ZAPD a ci4 PNG, it just seems to make a mess of
+    # it?  ZAPD extracts vanilla ci4 textures as ci8 PNGs, so
+    # maybe those would work... PIL documents a "bits" flag to save() that lets you
+    # specify ci8, but it doesn't work. And converting PNGs
+    # with ImageMagick with "png8:filename" doesn't preserve
+    # colour indices.
+    #
+    # Let's just write our own god damn file.
+    for half, path in zip(halves, c_half_paths):
+        z64tex.write(z64tex.encode(half, 'ci4'), path)
+
+
+def save_ci4_png(pixels, path):
+    image = PIL.Image.fromarray(pixels.astype(np.uint8)).convert('P')
+    image.putpalette(image_utils.ci4_palette)
+    image.save(path)
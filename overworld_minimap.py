@@ -1,10 +1,10 @@
 import collections
 
-import PIL.Image
-
-from . import image_utils
+from . import minimap_images
 from . import minimap_utils
+from . import render_cache
 from . import z64c
+from . import z64tex
 
 from .scene_map import MapCamera, Image
 from .utils import *
@@ -63,49 +63,29 @@ class OverworldMinimap:
 
 
     @cached_property
+    @yield_list
     def diffs(self):
+        map_data = self.scene_map.map_data
+
         # - sOwMinimapTexOffset
         # - sOwMinimapTexSize
-        # These tell the game where the texture is so it can load it. We need
-        # to rewrite the offset array because we might have shifted the other
-        # maps around if we changed this map's size.
+        # These tell the game where the texture is so it can load it.
+        # Setting the size also rewrites the offsets, because we might
+        # have shifted the other maps around if we changed this map's
+        # size.
         num_pixels = self.minimap_size[0] * self.minimap_size[1]
         num_bytes = num_pixels // 2 # It's a 4bpp image.
         assert num_bytes % 8 == 0
 
-        sOwMinimapTexSize = z64c.read_array(
-            app.scene.oot_dir,
-            'src/code/z_map_data.c',
-            'sOwMinimapTexSize'
-        )
-        sOwMinimapTexSize[self.index] = num_bytes
-        sOwMinimapTexOffset = [
-            sum(sOwMinimapTexSize[0:i])
-            for i in range(24)
-        ]
-        yield z64c.CArray(
-            'src/code/z_map_data.c',
-            'sOwMinimapTexOffset',
-            [
-                '0x%04X' % x
-                for x in sOwMinimapTexOffset
-            ]
-        )
-        yield z64c.CArray(
-            'src/code/z_map_data.c',
-            'sOwMinimapTexSize',
-            sOwMinimapTexSize
-        )
+        map_data.set('sOwMinimapTexSize', self.index, num_bytes)
 
         # Minimap size in pixels
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sOwMinimapWidth',
             self.index,
             self.minimap_size[0]
         )
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sOwMinimapHeight',
             self.index,
             self.minimap_size[1]
@@ -121,37 +101,32 @@ class OverworldMinimap:
             222 - self.minimap_size[1]
         )
             
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sOwMinimapPosX',
             self.index,
             minimap_pos[0]
         )
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sOwMinimapPosY',
             self.index,
             minimap_pos[1]
         )
 
         # TODO: We don't support entrance icons yet
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sOwEntranceIconPosX',
             self.index,
-            1,
+            1
         )
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sOwEntranceIconPosY',
             self.index,
-            0,
+            0
         )
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sOwEntranceFlag',
             self.index,
-            '0xFFFF',
+            z64c.CInt('0xFFFF')
         )
 
         # Compass data
@@ -167,8 +142,7 @@ class OverworldMinimap:
         scale_x_recip = round(1 / transform[0][0])
         scale_y_recip = round(1 / transform[0][0])
 
-        yield z64c.CArrayItem(
-            'src/code/z_map_data.c',
+        map_data.set(
             'sOwCompassInfo',
             self.index,
             [scale_x_recip, scale_y_recip, compass_offset_x, compass_offset_y]
@@ -185,9 +159,14 @@ class OverworldMinimap:
             to_path=map_grand_static_png
         )
 
-        # ZAPD will create an .inc.c file from the PNG when we build
-        # OOT. Include it in the map_grand_static file.
+        # We've already converted the PNG to an .inc.c file, so install
+        # that too and ZAPD won't need to when we build OOT. Include it
+        # in the map_grand_static file.
         map_grand_static_include = map_grand_static_png.replace('.png', '.inc.c')
+        yield z64c.InstallFile(
+            from_path=self.final_image.inc_c_path,
+            to_path='build/' + map_grand_static_include
+        )
         yield z64c.ReplaceIncludes(
             path='assets/textures/map_grand_static/map_grand_static.c',
             names=[f'gScene{self.index}MinimapTex'],
@@ -250,127 +229,29 @@ class OverworldMinimap:
             layer_colors.append(color)
             layer_image_paths.append(self.camera.image.render_path)
 
-        self.minimap_size, self.shift = process_image(
-            layer_colors,
-            layer_image_paths,
-            self.final_image.render_path
-        )
-
-
-def process_image(layer_colors, layer_paths, processed_path):
-    """
-    Take a raw camera render and turn it into a stylized
-    map for use in the game.
-
-    This is only for overworld minimaps; dungeon minimaps
-    are different enough that they have their own function.
-    """
-    layer_images = [PIL.Image.open(x) for x in layer_paths]
-    layer_masks = [x.split()[3] for x in layer_images]
-    size = layer_images[0].size
-
-    out_image = PIL.Image.new('P', size)
-    out_image.putpalette(image_utils.ia4_palette, 'RGBA')
-
-    composed = PIL.Image.new('P', size)
-    composed.putpalette(image_utils.ia4_palette, 'RGBA')
-
-    w, h = out_image.size
-
-    pix_wall = image_utils.ia4(7, 1)
-    pix_ground = image_utils.ia4(3, 1)
-    pix_outline = image_utils.ia4(0, 1)
-    pix_oob = image_utils.ia4(0, 0)
-
-    # Compose layers to 'composed'
-    for i, (layer_color, layer_alpha) in enumerate(zip(layer_colors, layer_masks)):
-        for y in range(h):
-            for x in range(w):
-                p = (x, y)
-                in_alpha = layer_alpha.getpixel(p)
-                if in_alpha != 0:
-                    composed.putpixel(p, image_utils.ia4(layer_color, 1))
-    
-    # Copy 'composed' to 'out_image' and add first outline
-    for y in range(h):
-        for x in range(w):
-            p = (x, y)
-            composed_pixel = composed.getpixel(p)
-            if composed_pixel == 0:
-                if any(
-                    image_utils.get(composed, (x+dx, y+dy), 0) != 0
-                    for (dx, dy) in image_utils.dirs8
-                ):
-                    out_image.putpixel(p, pix_wall)
-            else:
-                out_image.putpixel(p, composed_pixel)
-
-    # Second outline with boxy shadow
-    for y in range(h):
-        for x in range(w):
-            p = (x, y)
-            pixel = out_image.getpixel(p)
-            if pixel == pix_oob:
-                if any(
-                    image_utils.get(out_image, (x+dx, y+dy), pix_oob) in [pix_wall, pix_ground]
-                    for (dx, dy) in image_utils.dirs8 + [
-                            (-2, 0), (-2, 1), (-2, -1),
-                            (0, -2), (1, -2), (-1, -2)
-                    ]
-                ):
-                    out_image.putpixel(p, pix_outline)
-
-    # Find bounds
-    x0 = None
-    y0 = None
-    x1 = None
-    y1 = None
-    for y in range(h):
-        for x in range(w):
-            p = (x, y)
-            pixel = out_image.getpixel(p)
-            if pixel != pix_oob:
-                if x0 is None or p[0] < x0: x0 = p[0]
-                if x1 is None or p[0] > x1: x1 = p[0]
-                if y0 is None or p[1] < y0: y0 = p[1]
-                if y1 is None or p[1] > y1: y1 = p[1]
-
-    if x0 is None:
-        # Empty image
-        shift = mathutils.Vector((0, 0))
-
-    else:
-        bounds = Rect.bounding_points(
-            Vec2(x0, y0),
-            Vec2(x1, y1)
+        def process():
+            size, shift = minimap_images.process_overworld_minimap(
+                layer_colors,
+                layer_image_paths,
+                self.final_image.render_path
+            )
+            z64tex.convert(
+                self.final_image.render_path,
+                self.final_image.inc_c_path,
+                'ia4'
+            )
+            return [list(size), list(shift)]
+
+        size, shift = self.scene_map.render_cache.get(
+            self.final_image.name,
+            [self.final_image.render_path, self.final_image.inc_c_path],
+            render_cache.key_of(
+                'overworld minimap',
+                minimap_images.overworld_minimap_version,
+                layer_colors,
+                [file_hash(path) for path in layer_image_paths]
+            ),
+            process
         )
-
-        # All maps have widths as a multiple of 16. Probably required
-        # for alignment, so let's do it.
-        x_error = bounds.size.x % 16
-        if x_error:
-            x_error = 16 - x_error
-            xl = x_error // 2
-            xr = x_error - xl
-            bounds.origin.x -= xl
-            bounds.size.x += xl + xr
-
-        assert bounds.size.x % 16 == 0
-        assert 0 <= bounds.size.x <= 96
-
-
-        print('crop to', bounds)
-        out_image = out_image.crop((
-            bounds.min.x, bounds.min.y, bounds.max.x, bounds.max.y
-        ))
-
-        shift = mathutils.Vector((
-            96 - bounds.max.x,
-            85 - bounds.max.y
-        ))
-        print('shift is', shift)
-
-    out_image = out_image.convert('RGBA')
-    out_image.save(processed_path)
-
-    return out_image.size, shift
+        self.minimap_size = tuple(size)
+        self.shift = mathutils.Vector(shift)
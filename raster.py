@@ -0,0 +1,143 @@
+'''
+A software rasterizer for top-down orthographic map renders.
+
+Map renders are flat silhouettes, so there's no need to start Cycles for
+them. This draws triangles straight into an RGBA array, nearest-to-camera
+wins, with the same framing Blender uses for an orthographic camera
+looking straight down, and the same layout as a Cycles render with a
+transparent film: colour where there's geometry, alpha 0 everywhere else.
+
+Like the DMVoid backfacing shader, front faces are drawn green and back
+faces red. Dungeon minimaps use red to find the cut-away insides of
+walls and floors.
+
+Doesn't need bpy; see SceneMap.render_map_camera for the Blender side.
+'''
+import numpy as np
+import PIL.Image
+
+
+# Limit on (triangle, pixel) pairs tested at once, to bound memory use.
+chunk_pairs = 1 << 22
+
+front_color = (0, 255, 0, 255)
+back_color = (255, 0, 0, 255)
+
+
+def view_size(camera_scale, resolution):
+    '''
+    World-space size of the view. Like Blender's default "auto" sensor
+    fit, the ortho scale spans the longer side of the image.
+    '''
+    w, h = resolution
+    if w >= h:
+        return camera_scale, camera_scale * h / w
+    return camera_scale * w / h, camera_scale
+
+
+def rasterize(
+    triangles,
+    camera_pos,
+    camera_scale,
+    resolution,
+    camera_z=100,
+    clip=(0.1, 1000)
+):
+    '''
+    triangles: (N, 3, 3) world-space vertex positions. A triangle is
+        facing the camera if its vertices go anticlockwise seen from above.
+    camera_pos: camera XY, in world space.
+    clip: the camera's clip start and end, measured down from camera_z.
+
+    Returns an (h, w, 4) uint8 array, top row first.
+    '''
+    w, h = int(resolution[0]), int(resolution[1])
+    view_w, view_h = view_size(camera_scale, (w, h))
+
+    pixels = np.zeros((h, w, 4), dtype=np.uint8)
+    triangles = np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 3)
+    if len(triangles) == 0:
+        return pixels
+
+    # To pixel space, with pixel (i, j) centred on (i + .5, j + .5).
+    u = (triangles[:, :, 0] - (camera_pos[0] - view_w / 2)) * (w / view_w)
+    v = ((camera_pos[1] + view_h / 2) - triangles[:, :, 1]) * (h / view_h)
+    z = triangles[:, :, 2]
+
+    area = (
+        (u[:, 1] - u[:, 0]) * (v[:, 2] - v[:, 0])
+        - (u[:, 2] - u[:, 0]) * (v[:, 1] - v[:, 0])
+    )
+
+    # v runs down the image, so anticlockwise from above, which is
+    # facing the camera, comes out as negative area.
+    colors = np.where((area < 0)[:, None], front_color, back_color).astype(np.uint8)
+
+    # Pixel centres each triangle's bounding box could cover.
+    i0 = np.clip(np.ceil(u.min(axis=1) - .5), 0, w).astype(np.int64)
+    i1 = np.clip(np.floor(u.max(axis=1) - .5), -1, w - 1).astype(np.int64)
+    j0 = np.clip(np.ceil(v.min(axis=1) - .5), 0, h).astype(np.int64)
+    j1 = np.clip(np.floor(v.max(axis=1) - .5), -1, h - 1).astype(np.int64)
+
+    # Walls seen edge-on have no area and can't be seen.
+    keep = (np.abs(area) > 1e-12) & (i1 >= i0) & (j1 >= j0)
+    tris = np.nonzero(keep)[0]
+    box_w = (i1 - i0 + 1)[tris]
+    counts = box_w * (j1 - j0 + 1)[tris]
+
+    depth = np.full(w * h, -np.inf)
+    winner = np.full(w * h, -1, dtype=np.int64)
+
+    # Split the triangles into chunks of roughly chunk_pairs pairs.
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    splits = np.searchsorted(ends, np.arange(chunk_pairs, ends[-1] if len(ends) else 0, chunk_pairs))
+    for chunk in np.split(np.arange(len(tris)), splits):
+        if len(chunk) == 0:
+            continue
+
+        # One row per (triangle, pixel in its bounding box).
+        pair_tri = np.repeat(chunk, counts[chunk])
+        local = np.arange(len(pair_tri)) - np.repeat(starts[chunk] - starts[chunk[0]], counts[chunk])
+        t = tris[pair_tri]
+        px = i0[t] + local % box_w[pair_tri]
+        py = j0[t] + local // box_w[pair_tri]
+        cu = px + .5
+        cv = py + .5
+
+        # Barycentric weights from edge functions, scaled by area.
+        u0, u1, u2 = u[t, 0], u[t, 1], u[t, 2]
+        v0, v1, v2 = v[t, 0], v[t, 1], v[t, 2]
+        b0 = (u2 - u1) * (cv - v1) - (v2 - v1) * (cu - u1)
+        b1 = (u0 - u2) * (cv - v2) - (v0 - v2) * (cu - u2)
+        b2 = (u1 - u0) * (cv - v0) - (v1 - v0) * (cu - u0)
+        sign = np.sign(area[t])
+        inside = (b0 * sign >= 0) & (b1 * sign >= 0) & (b2 * sign >= 0)
+
+        pz = (b0 * z[t, 0] + b1 * z[t, 1] + b2 * z[t, 2]) / area[t]
+        inside &= (pz <= camera_z - clip[0]) & (pz >= camera_z - clip[1])
+
+        pix = (py * w + px)[inside]
+        pz = pz[inside]
+        t = t[inside]
+        if len(pix) == 0:
+            continue
+
+        # Highest sample per pixel
+        order = np.lexsort((pz, pix))
+        pix, pz, t = pix[order], pz[order], t[order]
+        last = np.append(pix[1:] != pix[:-1], True)
+        pix, pz, t = pix[last], pz[last], t[last]
+
+        better = pz > depth[pix]
+        depth[pix[better]] = pz[better]
+        winner[pix[better]] = t[better]
+
+    covered = winner >= 0
+    flat = pixels.reshape(-1, 4)
+    flat[covered] = colors[winner[covered]]
+    return pixels
+
+
+def save_png(pixels, path):
+    PIL.Image.fromarray(pixels).save(path)
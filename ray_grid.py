@@ -0,0 +1,179 @@
+'''
+Cast lots of rays against lots of triangles with numpy.
+
+mathutils' BVHTree can only cast one ray per call, which means a Python
+call per ray; baking AO on a big mesh is millions of them. Instead,
+triangles are put in a uniform grid, and every ray in a chunk walks
+through the grid a cell at a time together (Amanatides & Woo 1987). At
+each step, each ray is tested against the triangles in its cell with a
+vectorized Moller-Trumbore test, and rays stop once they've hit
+something nearer than the far side of their cell.
+
+Like BVHTree.ray_cast, triangles are hit from either side.
+
+Doesn't need bpy; see vertex_bake for the Blender side.
+'''
+import numpy as np
+
+
+# Most cells per axis; more than this just wastes memory.
+max_cells = 128
+
+# Roughly how many cells to make per triangle
+cells_per_triangle = 2
+
+# Rays walked through the grid at once, to bound memory use.
+chunk_rays = 16384
+
+
+class TriangleGrid:
+    def __init__(self, triangles):
+        '''triangles: (N, 3, 3) world-space vertex positions.'''
+        triangles = np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 3)
+        self.v0 = triangles[:, 0]
+        self.e1 = triangles[:, 1] - triangles[:, 0]
+        self.e2 = triangles[:, 2] - triangles[:, 0]
+
+        if len(triangles) == 0:
+            self.lo = np.zeros(3)
+            self.hi = np.zeros(3)
+            self.shape = np.ones(3, dtype=np.int64)
+            self.cell_size = np.ones(3)
+            self.cell_starts = np.zeros(2, dtype=np.int64)
+            self.cell_tris = np.empty(0, dtype=np.int64)
+            return
+
+        # Pad the bounds a little, so triangles on the edge are inside.
+        lo = triangles.min(axis=(0, 1))
+        hi = triangles.max(axis=(0, 1))
+        pad = max((hi - lo).max() * 1e-6, 1e-6)
+        self.lo = lo - pad
+        self.hi = hi + pad
+        extent = self.hi - self.lo
+
+        # Cubic cells, about cells_per_triangle of them per triangle. A
+        # flat scene still gets cells across its flat axis.
+        sized = np.maximum(extent, extent.max() / max_cells)
+        size = (sized.prod() / (cells_per_triangle * len(triangles))) ** (1 / 3)
+        self.shape = np.clip(np.ceil(extent / size), 1, max_cells).astype(np.int64)
+        self.cell_size = extent / self.shape
+
+        # One row per (triangle, cell its bounding box covers)
+        c0 = self.cells_of(triangles.min(axis=1))
+        c1 = self.cells_of(triangles.max(axis=1))
+        box = c1 - c0 + 1
+        counts = box.prod(axis=1)
+        tri = np.repeat(np.arange(len(triangles)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        box = box[tri]
+        cells = c0[tri] + np.stack([
+            local // (box[:, 1] * box[:, 2]),
+            local // box[:, 2] % box[:, 1],
+            local % box[:, 2],
+        ], axis=1)
+
+        # Triangles sorted by cell, and where each cell's start
+        cell = self.cell_number(cells)
+        order = np.argsort(cell, kind='stable')
+        self.cell_tris = tri[order]
+        self.cell_starts = np.searchsorted(cell[order], np.arange(self.shape.prod() + 1))
+
+    def cells_of(self, points):
+        '''Grid cell of each point, clamped to the grid.'''
+        cells = np.floor((points - self.lo) / self.cell_size).astype(np.int64)
+        return np.clip(cells, 0, self.shape - 1)
+
+    def cell_number(self, cells):
+        return (cells[:, 0] * self.shape[1] + cells[:, 1]) * self.shape[2] + cells[:, 2]
+
+    def ray_distances(self, origins, directions, distance):
+        '''
+        How far each ray goes before hitting something, or inf, in units
+        of its direction's length. distance is how far to look, for all
+        rays or each one.
+        '''
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        distance = np.broadcast_to(np.asarray(distance, dtype=np.float64), len(origins))
+
+        result = np.full(len(origins), np.inf)
+        if len(self.cell_tris) == 0:
+            return result
+
+        for start in range(0, len(origins), chunk_rays):
+            end = start + chunk_rays
+            result[start:end] = self.trace(
+                origins[start:end], directions[start:end], distance[start:end]
+            )
+        return result
+
+    def trace(self, o, d, max_t):
+        n = len(o)
+        best = np.full(n, np.inf)
+
+        # Where each ray is inside the grid's bounds
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inv = 1 / d
+            t0 = (self.lo - o) * inv
+            t1 = (self.hi - o) * inv
+        zero = d == 0
+        inside = (self.lo <= o) & (o <= self.hi)
+        t_min = np.where(zero, np.where(inside, -np.inf, np.inf), np.minimum(t0, t1))
+        t_max = np.where(zero, np.where(inside, np.inf, -np.inf), np.maximum(t0, t1))
+        t_enter = np.maximum(t_min.max(axis=1), 0)
+        t_leave = np.minimum(t_max.min(axis=1), max_t)
+
+        # Each ray's cell, and how far along it the next cell boundary
+        # is on each axis. Rays that miss the grid are never walked.
+        entering = t_enter <= t_leave
+        rays = np.flatnonzero(entering)
+        cell = self.cells_of(o + d * np.where(entering, t_enter, 0)[:, None])
+        step = np.sign(d).astype(np.int64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            boundary = self.lo + (cell + (step > 0)) * self.cell_size
+            t_next = np.where(zero, np.inf, (boundary - o) * inv)
+            t_delta = np.where(zero, np.inf, self.cell_size * np.abs(inv))
+
+        while len(rays):
+            cells = self.cell_number(cell[rays])
+            starts = self.cell_starts[cells]
+            counts = self.cell_starts[cells + 1] - starts
+
+            pair_ray = np.repeat(rays, counts)
+            pair_tri = self.cell_tris[
+                np.repeat(starts - (np.cumsum(counts) - counts), counts)
+                + np.arange(counts.sum())
+            ]
+            t = self.intersect(o[pair_ray], d[pair_ray], pair_tri)
+            hit = t <= max_t[pair_ray]
+            np.minimum.at(best, pair_ray[hit], t[hit])
+
+            # Nothing past this cell can be nearer than a hit before its
+            # far side.
+            t_exit = t_next[rays].min(axis=1)
+            rays = rays[(best[rays] > t_exit) & (t_exit < t_leave[rays])]
+
+            axis = np.argmin(t_next[rays], axis=1)
+            cell[rays, axis] += step[rays, axis]
+            t_next[rays, axis] += t_delta[rays, axis]
+            rays = rays[(cell[rays, axis] >= 0) & (cell[rays, axis] < self.shape[axis])]
+
+        return best
+
+    def intersect(self, o, d, tris):
+        '''Moller-Trumbore: how far along each ray its triangle is, or inf.'''
+        e1 = self.e1[tris]
+        e2 = self.e2[tris]
+        p = np.cross(d, e2)
+        det = np.einsum('ij,ij->i', e1, p)
+        ok = np.abs(det) > 1e-12
+        inv_det = 1 / np.where(ok, det, 1)
+
+        s = o - self.v0[tris]
+        u = np.einsum('ij,ij->i', s, p) * inv_det
+        q = np.cross(s, e1)
+        v = np.einsum('ij,ij->i', d, q) * inv_det
+        t = np.einsum('ij,ij->i', e2, q) * inv_det
+
+        hit = ok & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > 0)
+        return np.where(hit, t, np.inf)
@@ -0,0 +1,72 @@
+'''
+Skip re-making map renders and processed images whose inputs haven't
+changed.
+
+Each output is made from a key: a hash of everything that went into it.
+The key is saved with the output in the artifact store, along with
+whatever the step returned (e.g. a minimap's shift), and the next time
+the same key comes up the step is skipped and the saved result returned
+instead.
+'''
+from dataclasses import dataclass, field
+
+import hashlib
+import os
+
+import numpy as np
+
+from .common_utils import *
+
+
+def key_of(*parts):
+    '''Hash of parts, which can be numpy arrays or anything with a stable repr.'''
+    h = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            h.update(repr((part.dtype.str, part.shape)).encode())
+            h.update(np.ascontiguousarray(part).tobytes())
+        else:
+            h.update(repr(part).encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+@dataclass
+class RenderCache:
+    store: object
+    hits: list = field(default_factory=list)
+    misses: list = field(default_factory=list)
+
+    def get(self, label, paths, key, make):
+        '''
+        Make the files at paths by calling make(), unless they already
+        exist and were made from the same key. Returns make()'s result,
+        which must survive being saved as JSON.
+        '''
+        saved = self.store.meta(paths[0])
+
+        if saved is None:
+            reason = "not made before"
+        elif saved['key'] != key:
+            reason = "inputs changed"
+        elif not all(os.path.exists(path) for path in paths):
+            reason = "output missing"
+        else:
+            self.hits.append(label)
+            self.store.touch(paths)
+            return saved['result']
+
+        self.misses.append((label, reason))
+
+        # If make() fails halfway, this also means the old key isn't
+        # left claiming the half-written outputs are good.
+        self.store.release(paths)
+
+        result = make()
+        self.store.commit(paths, {'key': key, 'result': result})
+        return result
+
+    def log_summary(self):
+        log(f"Render cache: {len(self.hits)} hits, {len(self.misses)} misses")
+        for label, reason in self.misses:
+            log(f"    Remade {label}: {reason}")
@@ -1,3 +1,4 @@
+import bisect
 import itertools
 import os
 import functools
@@ -6,6 +7,8 @@ import bpy
 import mathutils
 
 from . import z64c
+from . import artifact_store
+from . import box_index
 from . import materials
 
 from .utils import *
@@ -35,6 +38,26 @@ class Scene:
     def render_dir(self):
         return f'{self.oot_dir}/build/oot-scene-tool'
 
+    @cached_property
+    def artifacts(self):
+        return artifact_store.ArtifactStore(
+            self.render_dir,
+            max_bytes=self.blender_scene.rgaArtifactCacheMB << 20
+        )
+
+    @property
+    def map_renderer(self):
+        return self.blender_scene.rgaMapRenderer
+
+    @property
+    def manifest_path(self):
+        # Keep manifests next to the .blend file rather than in the
+        # decomp, so they survive a git clean and can be shared.
+        if bpy.data.filepath:
+            blend_dir = os.path.dirname(bpy.data.filepath)
+            return f'{blend_dir}/oot-scene-tool/{self.enum_name}.json'
+        return f'{self.render_dir}/manifests/{self.enum_name}.json'
+
     @property
     def fast64_scene_option(self):
         return self.blender_scene.ootSceneExportSettings.option
@@ -110,6 +133,19 @@ class Scene:
             if obj.type == 'EMPTY' and obj.ootEmptyType == 'Room'
         ]
 
+    @cached_property
+    def catchment_index(self):
+        '''Which rooms' catchment boxes points and faces are in.'''
+        boxes = [
+            (room, box)
+            for room in self.rooms
+            for box in room.catchment_boxes
+        ]
+        return box_index.BoxIndex(
+            [object_bounds(box) for _, box in boxes],
+            [room for room, _ in boxes]
+        )
+
     # TODO: Remove
     def get_room(self, index):
         for room in self.rooms:
@@ -153,6 +189,16 @@ class Room:
             if floor.z_range.intersection(bounds.z)
         ]
 
+    @cached_property
+    @yield_list
+    def catchment_boxes(self):
+        i = 0
+        for child in self.fast64_object.children:
+            if 'Bounds' in child.name:
+                child.name = f'Bounds{self.index}.{i}'
+                i += 1
+                yield child
+
     @cached_property
     def actors(self):
         return [
@@ -161,6 +207,20 @@ class Room:
             and x.ootEmptyType == 'Actor'
         ]
 
+    @cached_property
+    def actors_by_floor(self):
+        '''The room's actors, sorted into floors in one go.'''
+        floors = self.scene.floors
+        floor_z0s = [floor.z0 for floor in floors]
+
+        by_floor = {floor: [] for floor in floors}
+        for actor in self.actors:
+            z = actor.matrix_world.translation.z
+            i = bisect.bisect_right(floor_z0s, z) - 1
+            if i >= 0 and z < floors[i].z1:
+                by_floor[floors[i]].append(actor)
+        return by_floor
+
 
 class Layer:
     def __init__(self, room, floor):
@@ -174,14 +234,9 @@ class Layer:
     def index_in_room(self):
         return self.room.layers.index(self)
 
-    @cached_property
+    @property
     def actors(self):
-        z0, z1 = self.floor.z_range
-        return [
-            actor for actor
-            in self.room.actors
-            if z0 <= actor.matrix_world.translation.z < z1
-        ]
+        return self.room.actors_by_floor[self.floor]
 
 
 class Floor:
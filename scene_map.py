@@ -1,8 +1,11 @@
 import os
+import weakref
 
 from .utils import *
 
-from . import z64c, app, materials
+from . import app, materials
+from . import raster, render_cache
+from .map_data import MapData
 
 class SceneMap:
     '''
@@ -129,6 +132,11 @@ class SceneMap:
 
         self.scene = scene
 
+        # Each visible object's triangles and their hash, by name; see
+        # object_geometry.
+        self.object_geometries = {}
+        live_scene_maps.add(self)
+
         if self.dungeon_index is not None:
             self.minimap = DungeonMinimap(self)
             self.pause_map = DungeonPauseMap(self)
@@ -192,21 +200,24 @@ class SceneMap:
         # High to low, front-padded with 9999.0f.
         # Last one is ignored.
         if self.dungeon_index:
-            yield z64c.CArrayItem(
-                'src/code/z_map_data.c',
+            self.map_data.set(
                 'sFloorCoordY',
                 self.scene.index,
-                pad_front(
-                    list(reversed([floor.z0 * 10 for floor in self.scene.floors])),
-                    8,
-                    9999.0
-                )
+                list(reversed([floor.z0 * 10 for floor in self.scene.floors]))
             )
 
         yield from self.minimap.diffs
         if self.pause_map:
             yield from self.pause_map.diffs
 
+        # The minimap and pause map fill in map_data as they go, so
+        # this has to come last.
+        yield from self.map_data.diffs()
+
+    @cached_property
+    def map_data(self):
+        return MapData(self.scene.oot_dir)
+
     @functools.lru_cache
     def clipped_layer_geometry(self, layer):
         collection = self.scene.helper_collection(
@@ -275,7 +286,46 @@ class SceneMap:
 
         cam.data.type = 'ORTHO'
         cam.data.ortho_scale = map_camera.camera_scale
-        
+
+        # Skip the render if nothing it depends on has changed since
+        # last time. For Cycles the material names only stand in for
+        # the materials; edits to shader nodes won't cause a re-render.
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        objects = self.visible_objects()
+        geometries = [self.object_geometry(obj, depsgraph) for obj in objects]
+        key = render_cache.key_of(
+            'map render',
+            self.scene.map_renderer,
+            [(obj.name, geometry_key) for obj, (_, geometry_key) in zip(objects, geometries)],
+            [
+                [slot.material and slot.material.name for slot in obj.material_slots]
+                for obj in objects
+            ],
+            tuple(cam.location),
+            map_camera.camera_scale,
+            tuple(map_camera.resolution),
+            (cam.data.clip_start, cam.data.clip_end),
+        )
+
+        def render():
+            if self.scene.map_renderer == 'RASTER':
+                triangles = [object_triangles for object_triangles, _ in geometries]
+                self.rasterize_map_camera(
+                    map_camera,
+                    cam,
+                    np.concatenate(triangles) if triangles else np.zeros((0, 3, 3))
+                )
+            else:
+                self.render_map_camera_cycles(map_camera, cam)
+
+        self.render_cache.get(
+            map_camera.image.name,
+            [map_camera.image.render_path],
+            key,
+            render
+        )
+
+    def render_map_camera_cycles(self, map_camera, cam):
         bpy.context.scene.render.resolution_x = map_camera.resolution.x
         bpy.context.scene.render.resolution_y = map_camera.resolution.y
         bpy.context.scene.render.engine = 'CYCLES'
@@ -295,10 +345,64 @@ class SceneMap:
             write_still=True
         )
 
+    def visible_objects(self):
+        return [
+            obj for obj in bpy.data.objects
+            if obj.type == 'MESH' and not obj.hide_render
+        ]
+
+    def object_geometry(self, obj, depsgraph):
+        '''
+        obj's world-space triangles and a hash of them, worked out once
+        and kept until the depsgraph says obj has changed. Only the
+        rasterizer needs the triangles themselves; for Cycles they're
+        None.
+        '''
+        geometry = self.object_geometries.get(obj.name)
+        if geometry is None:
+            triangles, _ = evaluated_triangles(obj, depsgraph)
+
+            # A mirrored object's world-space triangles wind the other
+            # way, but Blender still shades them by their own normals.
+            if obj.matrix_world.determinant() < 0:
+                triangles = triangles[:, ::-1]
+
+            geometry = self.object_geometries[obj.name] = (
+                triangles if self.scene.map_renderer == 'RASTER' else None,
+                render_cache.key_of(triangles)
+            )
+        return geometry
+
+    def forget_objects(self, names):
+        for name in names:
+            self.object_geometries.pop(name, None)
+
+    def rasterize_map_camera(self, map_camera, cam, triangles):
+        '''
+        Draw the same image Cycles would with the DMVoid material, but
+        with raster.py: front faces green, back faces red.
+        '''
+        log(f"Rasterize {map_camera.image.render_path}")
+
+        pixels = raster.rasterize(
+            triangles,
+            camera_pos=(cam.location.x, cam.location.y),
+            camera_scale=map_camera.camera_scale,
+            resolution=map_camera.resolution,
+            camera_z=cam.location.z,
+            clip=(cam.data.clip_start, cam.data.clip_end)
+        )
+        raster.save_png(pixels, map_camera.image.render_path)
+
+    @cached_property
+    def render_cache(self):
+        return render_cache.RenderCache(self.scene.artifacts)
+
     def render_all(self):
         self.minimap.render_all()
         if self.pause_map:
             self.pause_map.render_all()
+        self.render_cache.log_summary()
 
     def install(self):
         pass
@@ -321,3 +425,20 @@ class MapCamera:
     resolution: object
     collection: object
     image: object
+
+
+# Every SceneMap still around, so forget_updated_objects can tell them
+# which objects have changed.
+live_scene_maps = weakref.WeakSet()
+
+
+def forget_updated_objects(scene, depsgraph):
+    '''depsgraph_update_post handler; see SceneMap.object_geometry.'''
+    names = [
+        update.id.name
+        for update in depsgraph.updates
+        if isinstance(update.id, bpy.types.Object)
+        and (update.is_updated_geometry or update.is_updated_transform)
+    ]
+    for scene_map in live_scene_maps:
+        scene_map.forget_objects(names)
@@ -1,18 +1,8 @@
-import mathutils
-import bmesh
-
-from .utils import *
+from dataclasses import dataclass
 
+import numpy as np
 
-@cache_as_property('_scene_split_catchment_boxes')
-@yield_list
-def room_catchment_boxes(room):
-    i = 0
-    for child in room.fast64_object.children:
-        if 'Bounds' in child.name:
-            child.name = f'Bounds{room.index}.{i}'
-            i += 1
-            yield child
+from .utils import *
 
 
 def can_split(scene):
@@ -37,110 +27,271 @@ def split(scene):
 
     for obj in bpy.data.objects:
         if 'ExpGen' in obj.name:
+            mesh = obj.data
             obj.parent = None
-            bpy.data.objects.remove(obj) 
+            bpy.data.objects.remove(obj)
+            if mesh and mesh.users == 0:
+                bpy.data.meshes.remove(mesh)
+
+    # Edit mode changes aren't in the mesh data until we leave it
+    if bpy.context.object and bpy.context.object.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
+
+    write_array(
+        geom_obj.data.polygons, 'hide',
+        np.zeros(len(geom_obj.data.polygons), dtype=bool)
+    )
+
+    bpy.context.view_layer.update()
 
-    for face in geom_obj.data.polygons:
-        face.hide = False
+    # Read the whole mesh once, and work out which faces go in each
+    # room from that. Faces touching several rooms' boxes go in all of
+    # them.
+    source = MeshArrays.read(geom_obj)
+    face_lo, face_hi = source.face_bounds()
+    log('splitting', geom_obj.name, '; npoly', len(face_lo))
+
+    faces_by_room = scene.catchment_index.items_by_owner(face_lo, face_hi)
 
     for room in scene.rooms:
-        room_geom = duplicate_object(geom_obj, collection)
-        room_geom.name = f'ExpGen {room} Geometry'
+        faces = faces_by_room.get(room, np.empty(0, dtype=np.int64))
+        log(room, ':', len(room.catchment_boxes), 'catchment boxes,', len(faces), 'faces')
+
+        if len(faces) == 0:
+            raise Exception(f"{room} has no vertices")
 
         # Reparent to fast64_obj
-        for vertex in room_geom.data.vertices:
-            vertex.co = (
-                geom_obj.matrix_world @ vertex.co -
-                (room.fast64_object.matrix_world @ mathutils.Vector((0,0,0)))
-            )
-        room_geom.location = (0, 0, 0)
-        room_geom.parent = room.fast64_object
+        origin = np.array(room.fast64_object.matrix_world.translation)
 
-        cull(room, room_geom)
+        room_geom = geom_obj.copy()
+        for coll in room_geom.users_collection:
+            coll.objects.unlink(room_geom)
+        collection.objects.link(room_geom)
+        room_geom.data = source.build(f'ExpGen {room} Geometry', faces, -origin)
+        room_geom.name = f'ExpGen {room} Geometry'
 
-        if len(room_geom.data.vertices) == 0:
-            raise Exception(f"{room} has no vertices")
+        room_geom.location = (0, 0, 0)
+        room_geom.parent = room.fast64_object
 
 
-def cull(room, geom):
-    mesh = geom.data
-    log('culling', geom.name, 'to', room, '; mesh', mesh, 'npoly', len(mesh.polygons))
+@dataclass
+class MeshArrays:
+    '''
+    A mesh read into flat arrays with foreach_get, with vertices in
+    world space, so pieces of it can be built into new meshes without
+    copying the whole thing.
+    '''
+    mesh: object
+    co: np.ndarray
+    loop_verts: np.ndarray
+    loop_starts: np.ndarray
+    loop_totals: np.ndarray
+    material_indices: np.ndarray
+    smooth: np.ndarray
+    uvs: list
+    colors: list
+    edge_keys: np.ndarray
+    seams: np.ndarray
+    sharp_edges: np.ndarray
+    creases: np.ndarray
+    attributes: list
+    normals: np.ndarray
+
+    @classmethod
+    def read(cls, obj):
+        mesh = obj.data
+
+        # Custom split normals, turned to world space like the vertices
+        normals = None
+        if mesh.has_custom_normals:
+            # Blender 4.1 keeps these up to date itself
+            if hasattr(mesh, 'calc_normals_split'):
+                mesh.calc_normals_split()
+            normal_matrix = np.array(obj.matrix_world.to_3x3().inverted_safe().transposed())
+            normals = read_array(mesh.loops, 'normal', np.float32, 3) @ normal_matrix.T
+            normals /= np.maximum(np.linalg.norm(normals, axis=1), 1e-12)[:, None]
+
+        # Edges are kept sorted by edge_key so build can look them up
+        edge_keys = edge_key(read_array(mesh.edges, 'vertices', np.int32, 2), len(mesh.vertices))
+        edge_order = np.argsort(edge_keys)
+
+        # Blender 4 keeps crease in a generic attribute instead
+        creases = None
+        if 'crease' in bpy.types.MeshEdge.bl_rna.properties:
+            creases = read_array(mesh.edges, 'crease')[edge_order]
+
+        handled = {'position', 'material_index', 'sharp_face', 'sharp_edge'}
+        handled.update(layer.name for layer in mesh.uv_layers)
+        handled.update(attr.name for attr in mesh.color_attributes)
+
+        return cls(
+            mesh=mesh,
+            co=world_vertex_cos(obj),
+            loop_verts=read_array(mesh.loops, 'vertex_index', np.int32),
+            loop_starts=read_array(mesh.polygons, 'loop_start', np.int32),
+            loop_totals=read_array(mesh.polygons, 'loop_total', np.int32),
+            material_indices=read_array(mesh.polygons, 'material_index', np.int32),
+            smooth=read_array(mesh.polygons, 'use_smooth', bool),
+            uvs=[
+                (layer.name, read_array(layer.data, 'uv', np.float32, 2))
+                for layer in mesh.uv_layers
+            ],
+            colors=[
+                (attr.name, attr.data_type, attr.domain, read_colors(attr))
+                for attr in mesh.color_attributes
+            ],
+            edge_keys=edge_keys[edge_order],
+            seams=read_array(mesh.edges, 'use_seam', bool)[edge_order],
+            sharp_edges=read_array(mesh.edges, 'use_edge_sharp', bool)[edge_order],
+            creases=creases,
+            attributes=[
+                (
+                    attr.name, attr.data_type, attr.domain,
+                    read_attribute(attr, edge_order)
+                )
+                for attr in mesh.attributes
+                if attr.name not in handled
+                and not attr.name.startswith('.')
+                and attr.data_type in attribute_layouts
+                and attr.domain in ['POINT', 'EDGE', 'FACE', 'CORNER']
+            ],
+            normals=normals,
+        )
 
-    catchment_boxes = room_catchment_boxes(room)
-    log(len(catchment_boxes), 'catchment boxes')
+    def face_bounds(self):
+        '''World-space bounds of every face, as (N, 3) arrays of mins and maxes.'''
+        if len(self.loop_starts) == 0:
+            return np.empty((0, 3)), np.empty((0, 3))
 
-    started_with = len(mesh.polygons)
-    
-    bpy.context.view_layer.update()
+        # Each polygon's loops come right after the previous polygon's
+        loop_co = self.co[self.loop_verts]
+        return (
+            np.minimum.reduceat(loop_co, self.loop_starts),
+            np.maximum.reduceat(loop_co, self.loop_starts),
+        )
 
+    def build(self, name, faces, offset=(0, 0, 0)):
+        '''
+        A new mesh of just the given faces and the vertices they use,
+        moved by offset.
+        '''
+        totals = self.loop_totals[faces]
+        starts = np.cumsum(totals) - totals
+        loops = (
+            np.repeat(self.loop_starts[faces] - starts, totals)
+            + np.arange(totals.sum())
+        )
+        verts, loop_verts = np.unique(self.loop_verts[loops], return_inverse=True)
+
+        mesh = bpy.data.meshes.new(name)
+
+        mesh.vertices.add(len(verts))
+        write_array(mesh.vertices, 'co', self.co[verts] + offset, np.float32)
+
+        mesh.loops.add(len(loops))
+        write_array(mesh.loops, 'vertex_index', loop_verts, np.int32)
+
+        mesh.polygons.add(len(faces))
+        write_array(mesh.polygons, 'loop_start', starts, np.int32)
+        # Blender 4 works this out from loop_start, and won't let us set it
+        if not bpy.types.MeshPolygon.bl_rna.properties['loop_total'].is_readonly:
+            write_array(mesh.polygons, 'loop_total', totals, np.int32)
+        write_array(mesh.polygons, 'material_index', self.material_indices[faces])
+        write_array(mesh.polygons, 'use_smooth', self.smooth[faces])
+
+        mesh.update(calc_edges=True)
+
+        for layer_name, uv in self.uvs:
+            layer = mesh.uv_layers.new(name=layer_name, do_init=False)
+            write_array(layer.data, 'uv', uv[loops])
+        if self.mesh.uv_layers.active:
+            mesh.uv_layers.active_index = self.mesh.uv_layers.active_index
+
+        for attr_name, data_type, domain, color in self.colors:
+            attr = mesh.color_attributes.new(attr_name, data_type, domain)
+            write_colors(attr, color[verts] if domain == 'POINT' else color[loops])
+        if self.colors:
+            mesh.color_attributes.active_color_index = (
+                self.mesh.color_attributes.active_color_index
+            )
+            mesh.color_attributes.render_color_index = (
+                self.mesh.color_attributes.render_color_index
+            )
 
-    geom.hide_viewport = False
+        # Edges came from calc_edges, so find each one in the source
+        edge_verts = verts[read_array(mesh.edges, 'vertices', np.int32, 2)]
+        edges = np.searchsorted(self.edge_keys, edge_key(edge_verts, len(self.co)))
 
-    for obj in bpy.data.objects:
-        obj.select_set(False)
+        write_array(mesh.edges, 'use_seam', self.seams[edges])
+        write_array(mesh.edges, 'use_edge_sharp', self.sharp_edges[edges])
+        if self.creases is not None:
+            write_array(mesh.edges, 'crease', self.creases[edges])
 
-    geom.select_set(True)
-    bpy.context.view_layer.objects.active = geom
+        for attr_name, data_type, domain, values in self.attributes:
+            attr = mesh.attributes.new(attr_name, data_type, domain)
+            items = {'POINT': verts, 'EDGE': edges, 'FACE': faces, 'CORNER': loops}[domain]
+            write_array(attr.data, attribute_layouts[data_type][0], values[items])
 
-    bpy.ops.object.mode_set(mode = 'OBJECT', toggle=False) 
+        for material in self.mesh.materials:
+            mesh.materials.append(material)
 
-    bm = bmesh.new()
-    bm.from_mesh(mesh)
+        if self.normals is not None:
+            # Before Blender 4.1, custom normals only work with auto smooth on
+            if hasattr(mesh, 'use_auto_smooth'):
+                mesh.use_auto_smooth = True
+            mesh.normals_split_custom_set(self.normals[loops])
 
-    bm.faces.ensure_lookup_table()
+        # Custom properties, like the colour stack and MergedColorsKey
+        for key, value in self.mesh.items():
+            mesh[key] = value
 
-    faces_to_delete=[
-        face for face in bm.faces if not any(
-            bounds_intersection(
-                object_bounds(catchment_box),
-                face_bounds(geom, face)
-            )
-            for catchment_box in catchment_boxes
-        )
-    ]
+        return mesh
 
-    bmesh.ops.delete(
-        bm,
-        geom=faces_to_delete,
-        context='FACES'
-    )
 
-    bm.to_mesh(mesh)
+# How to read and write each type of generic attribute with
+# foreach_get: the property, its dtype and how many values each item has.
+attribute_layouts = {
+    'FLOAT': ('value', np.float32, 1),
+    'INT': ('value', np.int32, 1),
+    'INT8': ('value', np.int32, 1),
+    'BOOLEAN': ('value', bool, 1),
+    'FLOAT2': ('vector', np.float32, 2),
+    'FLOAT_VECTOR': ('vector', np.float32, 3),
+    'INT32_2D': ('value', np.int32, 2),
+    'QUATERNION': ('value', np.float32, 4),
+}
 
-    log('culled', geom.name, mesh, '; result npoly = ', len(mesh.polygons))
 
-    assert len(mesh.polygons) == started_with - len(faces_to_delete)
+def read_attribute(attr, edge_order):
+    '''A generic attribute's values; edge values in edge_order.'''
+    prop, dtype, width = attribute_layouts[attr.data_type]
+    values = read_array(attr.data, prop, dtype, width)
+    if attr.domain == 'EDGE':
+        return values[edge_order]
+    return values
 
 
-def face_bounds(obj, bm_face):
-    cos = [
-        obj.matrix_world @ vert.co
-        for vert in bm_face.verts
-    ]
-    
-    return points_bounds(cos)
+def edge_key(edge_verts, vertex_count):
+    '''One number per edge, the same whichever way round its vertices are.'''
+    edge_verts = np.sort(np.asarray(edge_verts, dtype=np.int64).reshape(-1, 2), axis=1)
+    return edge_verts[:, 0] * vertex_count + edge_verts[:, 1]
 
 
 def polygon_bounds(obj, mesh, polygon):
     
-    cos = [
-        obj.matrix_world @ mathutils.Vector(mesh.vertices[i].co)
-        for i in polygon.vertices
-    ]
-    
-    return points_bounds(cos)
+    return points_bounds(apply_matrix(
+        obj.matrix_world,
+        [mesh.vertices[i].co for i in polygon.vertices]
+    ))
 
 
 def move_actors_to_their_rooms(scene):
     move = {}
     for actor in scene.actors:
-        for room in scene.rooms:
+        pos = actor.matrix_world.translation
+        for room in scene.catchment_index.at_point(pos):
             if room.fast64_object != actor.parent:
-                for box in room_catchment_boxes(room):
-                    pos = actor.matrix_world.translation
-                    bounds = object_bounds(box)
-                    if bounds.contains(pos):
-                        move[actor] = room
+                move[actor] = room
 
     for actor, room in move.items():
         log(f"Move {actor} to {room}")
@@ -0,0 +1,26 @@
+'''
+The tool is a package (oot_scene_tool when installed in Blender), and
+its modules use relative imports, so tests import it by its directory
+name. Only modules that don't need bpy can be tested here.
+'''
+import importlib
+import os
+import sys
+
+import pytest
+
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+sys.path.insert(0, os.path.dirname(repo_dir))
+package_name = os.path.basename(repo_dir)
+
+
+def tool_module(name):
+    return importlib.import_module(f'{package_name}.{name}')
+
+
+@pytest.fixture
+def fixture_path():
+    return lambda name: os.path.join(fixtures_dir, name)
@@ -0,0 +1,61 @@
+import os
+import stat
+
+from conftest import tool_module
+
+artifact_store = tool_module('artifact_store')
+
+
+def make(store, name, data):
+    path = store.path(name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def writable(path):
+    return bool(os.stat(path).st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+def test_committed_files_are_read_only(tmp_path):
+    store = artifact_store.ArtifactStore(str(tmp_path))
+    a = make(store, 'a.png', b'same')
+    b = make(store, 'b.png', b'same')
+    store.commit([a, b])
+
+    assert os.path.samefile(a, b)
+    assert not writable(a)
+    assert not writable(b)
+
+
+def test_remaking_a_shared_file_leaves_the_others_alone(tmp_path):
+    store = artifact_store.ArtifactStore(str(tmp_path))
+    a = make(store, 'a.png', b'same')
+    b = make(store, 'b.png', b'same')
+    store.commit([a, b])
+
+    store.release([a])
+    make(store, 'a.png', b'different')
+    store.commit([a])
+
+    with open(b, 'rb') as f:
+        assert f.read() == b'same'
+    assert len(os.listdir(store.blob_dir)) == 2
+
+
+def test_release_only_collects_its_own_blobs(tmp_path):
+    store = artifact_store.ArtifactStore(str(tmp_path))
+    a = make(store, 'a.png', b'a')
+    b = make(store, 'b.png', b'b')
+    store.commit([a, b])
+
+    # Not in the index, so not this release's business
+    with open(os.path.join(store.blob_dir, 'stray.png'), 'wb') as f:
+        f.write(b'stray')
+
+    with store.locked_index() as index:
+        b_blob = index['b.png']['blob']
+
+    store.release([a])
+
+    assert sorted(os.listdir(store.blob_dir)) == sorted([b_blob, 'stray.png'])
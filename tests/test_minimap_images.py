@@ -0,0 +1,399 @@
+'''
+The minimap processors were per-pixel loops before they were rewritten
+with numpy. These check the numpy versions still make exactly the same
+images as frozen copies of the loops, on a few fixture renders.
+'''
+import numpy as np
+import PIL.Image
+import PIL.ImageDraw
+import PIL.ImageFilter
+import pytest
+
+from conftest import tool_module
+
+minimap_images = tool_module('minimap_images')
+common_utils = tool_module('common_utils')
+Rect = common_utils.Rect
+Vec2 = common_utils.Vec2
+
+
+dirs4 = [(-1,0),(1,0),(0,-1),(0,1)]
+dirs8 = dirs4 + [(-1,-1),(-1,1),(1,-1),(1,1)]
+
+ci4_palette = []
+for index in range(16):
+    v = index * 16
+    ci4_palette.extend([v, v, v])
+
+
+def get(image, co, default):
+    if co[0] < 0: return default
+    if co[1] < 0: return default
+    if co[0] >= image.width: return default
+    if co[1] >= image.height: return default
+    return image.getpixel(co)
+
+
+def legacy_process_dungeon_minimap(raw_path, processed_path):
+    '''The loop version, as it was before numpy. Returns the shift as a tuple.'''
+    raw_rgba = PIL.Image.open(raw_path)
+    raw_void, raw_surface, _, raw_alpha = raw_rgba.split()
+
+    out_image = PIL.Image.new('P', raw_alpha.size)
+    out_image.putpalette(ci4_palette)
+
+    w, h = out_image.size
+
+    x0 = None
+    y0 = None
+    x1 = None
+    y1 = None
+    for y in range(h):
+        for x in range(w):
+            p = (x, y)
+            in_alpha = raw_alpha.getpixel(p)
+            if in_alpha == 0:
+                if any(
+                    get(raw_alpha, (x+dx, y+dy), 0) != 0
+                    for (dx, dy) in dirs8
+                ):
+                    out_image.putpixel(p, 15)
+
+                    if x0 is None or p[0] < x0: x0 = p[0]
+                    if x1 is None or p[0] > x1: x1 = p[0]
+                    if y0 is None or p[1] < y0: y0 = p[1]
+                    if y1 is None or p[1] > y1: y1 = p[1]
+
+            else:
+                if raw_void.getpixel(p) > 128:
+                    if any(
+                        get(raw_surface, (x+dx, y+dy), 0) >= 128
+                        for (dx, dy) in dirs8
+                    ):
+                        out_image.putpixel(p, 15)
+                    else:
+                        out_image.putpixel(p, 0)
+                else:
+                    out_image.putpixel(p, 4)
+
+    bounds = Rect.bounding_points(Vec2(x0, y0), Vec2(x1, y1))
+    bounds = bounds.expand(5)
+    bounds.size.x -= 1
+    bounds.size.y -= 1
+
+    draw = PIL.ImageDraw.Draw(out_image)
+    draw.rectangle(
+        ((bounds.min.x, bounds.min.y), (bounds.max.x, bounds.max.y)),
+        outline=15
+    )
+
+    halo = PIL.Image.new('L', out_image.size)
+    for y in range(h):
+        for x in range(w):
+            pix = max(raw_alpha.getpixel((x, y)), out_image.getpixel((x, y)))
+            if pix != 0 or any(
+                get(raw_alpha, (x+dx, y+dy), 0)
+                for (dx, dy) in dirs4
+            ):
+                halo.putpixel((x, y), 0xb0)
+
+    draw = PIL.ImageDraw.Draw(halo)
+    draw.rectangle(
+        ((bounds.min.x, bounds.min.y), (bounds.max.x, bounds.max.y)),
+        outline=0x10
+    )
+    halo = halo.filter(PIL.ImageFilter.GaussianBlur(1))
+
+    for y in range(h):
+        for x in range(w):
+            p = out_image.getpixel((x, y))
+            mask = raw_alpha.getpixel((x, y))
+            if p != 0 or mask != 0:
+                halo.putpixel((x, y), p * 16)
+
+    out_image = halo
+
+    shift_x = w - 2 - bounds.max.x
+    shift_y = h - 2 - bounds.max.y
+
+    out_image = out_image.transform(
+        (w, h),
+        PIL.Image.AFFINE,
+        (1, 0, -shift_x, 0, 1, -shift_y),
+        fillcolor=0
+    )
+
+    out_image = out_image.convert('RGB')
+    out_image.save(processed_path)
+
+    return (shift_x, shift_y)
+
+
+def pixels(path):
+    return np.asarray(PIL.Image.open(path))
+
+
+@pytest.mark.parametrize('name', ['rooms', 'corner', 'sparse', 'dense'])
+def test_dungeon_minimap_matches_loop_version(name, fixture_path, tmp_path):
+    raw = fixture_path(f'dungeon_{name}.png')
+
+    shift = minimap_images.process_dungeon_minimap(raw, tmp_path / 'new.png')
+    legacy_shift = legacy_process_dungeon_minimap(raw, tmp_path / 'old.png')
+
+    assert tuple(shift) == legacy_shift
+    assert np.array_equal(pixels(tmp_path / 'new.png'), pixels(tmp_path / 'old.png'))
+
+
+def test_dungeon_minimap_empty(tmp_path):
+    raw = tmp_path / 'empty.png'
+    PIL.Image.new('RGBA', (96, 85)).save(raw)
+
+    shift = minimap_images.process_dungeon_minimap(raw, tmp_path / 'out.png')
+
+    assert tuple(shift) == (0, 0)
+    assert not pixels(tmp_path / 'out.png').any()
+
+
+def legacy_process_overworld_minimap(layer_colors, layer_paths, processed_path):
+    '''The loop version, as it was before numpy. Returns the shift as a tuple.'''
+    image_utils = tool_module('image_utils')
+
+    layer_images = [PIL.Image.open(x) for x in layer_paths]
+    layer_masks = [x.split()[3] for x in layer_images]
+    size = layer_images[0].size
+
+    out_image = PIL.Image.new('P', size)
+    out_image.putpalette(image_utils.ia4_palette, 'RGBA')
+
+    composed = PIL.Image.new('P', size)
+    composed.putpalette(image_utils.ia4_palette, 'RGBA')
+
+    w, h = out_image.size
+
+    pix_wall = image_utils.ia4(7, 1)
+    pix_ground = image_utils.ia4(3, 1)
+    pix_outline = image_utils.ia4(0, 1)
+    pix_oob = image_utils.ia4(0, 0)
+
+    for i, (layer_color, layer_alpha) in enumerate(zip(layer_colors, layer_masks)):
+        for y in range(h):
+            for x in range(w):
+                p = (x, y)
+                in_alpha = layer_alpha.getpixel(p)
+                if in_alpha != 0:
+                    composed.putpixel(p, image_utils.ia4(layer_color, 1))
+
+    for y in range(h):
+        for x in range(w):
+            p = (x, y)
+            composed_pixel = composed.getpixel(p)
+            if composed_pixel == 0:
+                if any(
+                    image_utils.get(composed, (x+dx, y+dy), 0) != 0
+                    for (dx, dy) in image_utils.dirs8
+                ):
+                    out_image.putpixel(p, pix_wall)
+            else:
+                out_image.putpixel(p, composed_pixel)
+
+    for y in range(h):
+        for x in range(w):
+            p = (x, y)
+            pixel = out_image.getpixel(p)
+            if pixel == pix_oob:
+                if any(
+                    image_utils.get(out_image, (x+dx, y+dy), pix_oob) in [pix_wall, pix_ground]
+                    for (dx, dy) in image_utils.dirs8 + [
+                            (-2, 0), (-2, 1), (-2, -1),
+                            (0, -2), (1, -2), (-1, -2)
+                    ]
+                ):
+                    out_image.putpixel(p, pix_outline)
+
+    x0 = None
+    y0 = None
+    x1 = None
+    y1 = None
+    for y in range(h):
+        for x in range(w):
+            p = (x, y)
+            pixel = out_image.getpixel(p)
+            if pixel != pix_oob:
+                if x0 is None or p[0] < x0: x0 = p[0]
+                if x1 is None or p[0] > x1: x1 = p[0]
+                if y0 is None or p[1] < y0: y0 = p[1]
+                if y1 is None or p[1] > y1: y1 = p[1]
+
+    if x0 is None:
+        shift = (0, 0)
+
+    else:
+        bounds = Rect.bounding_points(
+            Vec2(x0, y0),
+            Vec2(x1, y1)
+        )
+
+        x_error = bounds.size.x % 16
+        if x_error:
+            x_error = 16 - x_error
+            xl = x_error // 2
+            xr = x_error - xl
+            bounds.origin.x -= xl
+            bounds.size.x += xl + xr
+
+        out_image = out_image.crop((
+            bounds.min.x, bounds.min.y, bounds.max.x, bounds.max.y
+        ))
+
+        shift = (
+            96 - bounds.max.x,
+            85 - bounds.max.y
+        )
+
+    out_image = out_image.convert('RGBA')
+    out_image.save(processed_path)
+
+    return out_image.size, shift
+
+
+@pytest.mark.parametrize('name, layer_colors', [
+    ('field', [3, 5, 7]),
+    ('village', [3, 6]),
+])
+def test_overworld_minimap_matches_loop_version(name, layer_colors, fixture_path, tmp_path):
+    layer_paths = [
+        fixture_path(f'overworld_{name}_{i}.png')
+        for i in range(len(layer_colors))
+    ]
+
+    size, shift = minimap_images.process_overworld_minimap(
+        layer_colors, layer_paths, tmp_path / 'new.png'
+    )
+    legacy_size, legacy_shift = legacy_process_overworld_minimap(
+        layer_colors, layer_paths, tmp_path / 'old.png'
+    )
+
+    assert tuple(size) == tuple(legacy_size)
+    assert tuple(shift) == legacy_shift
+    assert np.array_equal(pixels(tmp_path / 'new.png'), pixels(tmp_path / 'old.png'))
+
+
+def test_overworld_minimap_empty(tmp_path):
+    raw = tmp_path / 'empty.png'
+    PIL.Image.new('RGBA', (96, 85)).save(raw)
+
+    size, shift = minimap_images.process_overworld_minimap([3], [raw], tmp_path / 'out.png')
+
+    assert tuple(size) == (96, 85)
+    assert tuple(shift) == (0, 0)
+
+
+def legacy_fast_outline(image, outline_color):
+    '''outline_color must not already exist in image.'''
+    for y in range(image.height):
+        for x in range(image.width):
+            if get(image, (x, y), 0) == 0:
+                if any(
+                    get(image, (x+dx, y+dy), 0) not in [0, outline_color]
+                    for (dx, dy) in dirs8
+                ):
+                    image.putpixel((x, y), outline_color)
+
+
+def legacy_dungeon_map_image_to_c(image_path, c_path):
+    image = PIL.Image.open(image_path)
+
+    with open(c_path, 'wt') as f:
+        i = 0
+        addr = 0
+        for y in range(85):
+            for x in range(48):
+                if i % 64 == 0:
+                    f.write('    ')
+                if i % 16 == 0:
+                    f.write('0x')
+                f.write('0123456789ABCDEF'[image.getpixel((x, y))])
+                i += 1
+                if i % 16 == 0:
+                    f.write(', ')
+
+                if i % 64 == 0:
+                    f.write(' // 0x%06X\n' % addr)
+                    addr += 32
+
+
+def legacy_compose_floor(layers, floor_path, half_paths, c_half_paths):
+    '''The loop version, as it was in DungeonPauseMap.render_all.'''
+    w, h = 96, 85
+
+    floor_map = PIL.Image.new('P', (w, h))
+    floor_map.putpalette(ci4_palette)
+
+    for render_path, room_palette_index in layers:
+        room_image = PIL.Image.open(render_path)
+        room_alpha = room_image.split()[-1]
+
+        for y in range(h):
+            for x in range(w):
+                if room_alpha.getpixel((x, y)):
+                    floor_map.putpixel((x, y), room_palette_index)
+
+    legacy_fast_outline(floor_map, 15)
+
+    floor_map.save(floor_path)
+
+    half = floor_map.crop((0, 0, 48, 85))
+    half.save(half_paths[0])
+
+    half = floor_map.crop((48, 0, 96, 85))
+    half.save(half_paths[1])
+
+    for i in [0, 1]:
+        legacy_dungeon_map_image_to_c(half_paths[i], c_half_paths[i])
+
+
+def test_outline_mask_matches_loop_version(fixture_path):
+    image_utils = tool_module('image_utils')
+
+    image = PIL.Image.open(fixture_path('dungeon_rooms.png')).split()[-1].point(
+        lambda a: 3 if a else 0
+    ).convert('P')
+    pixels = np.array(image)
+    pixels[image_utils.outline_mask(pixels, 15)] = 15
+
+    legacy_fast_outline(image, 15)
+
+    assert np.array_equal(pixels, np.asarray(image))
+
+
+@pytest.mark.parametrize('names', [
+    ['rooms'],
+    ['rooms', 'corner', 'sparse'],
+    ['dense', 'sparse'],
+])
+def test_compose_floor_matches_loop_version(names, fixture_path, tmp_path):
+    layers = [
+        (fixture_path(f'dungeon_{name}.png'), palette)
+        for palette, name in enumerate(names, start=2)
+    ]
+
+    def outputs(prefix):
+        return (
+            str(tmp_path / f'{prefix}_floor.png'),
+            [str(tmp_path / f'{prefix}_half{i}.png') for i in [0, 1]],
+            [str(tmp_path / f'{prefix}_half{i}.inc.c') for i in [0, 1]],
+        )
+
+    minimap_images.compose_floor(layers, *outputs('new'))
+    legacy_compose_floor(layers, *outputs('old'))
+
+    new_floor, new_halves, new_c_halves = outputs('new')
+    old_floor, old_halves, old_c_halves = outputs('old')
+
+    for new_path, old_path in zip([new_floor, *new_halves], [old_floor, *old_halves]):
+        assert PIL.Image.open(new_path).mode == PIL.Image.open(old_path).mode
+        assert np.array_equal(pixels(new_path), pixels(old_path))
+
+    for new_path, old_path in zip(new_c_halves, old_c_halves):
+        with open(new_path) as new_file, open(old_path) as old_file:
+            assert new_file.read() == old_file.read()
@@ -0,0 +1,69 @@
+'''
+The rasterizer has to draw what the Cycles backfacing shader does, since
+dungeon minimaps read back faces from red and front faces from green.
+'''
+import numpy as np
+
+from conftest import tool_module
+
+raster = tool_module('raster')
+
+
+def square(x0, y0, x1, y1, z, facing_up=True):
+    '''Two triangles covering a square, anticlockwise from above if facing_up.'''
+    triangles = np.array([
+        [(x0, y0, z), (x1, y0, z), (x1, y1, z)],
+        [(x0, y0, z), (x1, y1, z), (x0, y1, z)],
+    ], dtype=np.float64)
+    if not facing_up:
+        triangles = triangles[:, ::-1]
+    return triangles
+
+
+def draw(triangles):
+    return raster.rasterize(
+        triangles,
+        camera_pos=(0, 0),
+        camera_scale=10,
+        resolution=(10, 10),
+        camera_z=100,
+        clip=(0.1, 1000)
+    )
+
+
+def test_front_faces_are_green():
+    pixels = draw(square(-5, -5, 5, 5, 0))
+
+    assert (pixels[..., 0] == 0).all()
+    assert (pixels[..., 1] == 255).all()
+    assert (pixels[..., 3] == 255).all()
+
+
+def test_back_faces_are_red():
+    pixels = draw(square(-5, -5, 5, 5, 0, facing_up=False))
+
+    assert (pixels[..., 0] == 255).all()
+    assert (pixels[..., 1] == 0).all()
+    assert (pixels[..., 3] == 255).all()
+
+
+def test_nearest_face_decides_the_channel():
+    # A floor, with a cut-away wall interior on top of its left half,
+    # which Cycles would see from behind.
+    pixels = draw(np.concatenate([
+        square(-5, -5, 5, 5, 0),
+        square(-5, -5, 0, 5, 1, facing_up=False),
+    ]))
+
+    left = pixels[:, :5]
+    right = pixels[:, 5:]
+    assert (left[..., 0] > 128).all() and (left[..., 1] == 0).all()
+    assert (right[..., 1] >= 128).all() and (right[..., 0] == 0).all()
+    assert (pixels[..., 3] == 255).all()
+
+
+def test_empty_is_transparent():
+    pixels = draw(np.zeros((0, 3, 3)))
+
+    assert pixels.shape == (10, 10, 4)
+    assert not pixels.any()
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from conftest import tool_module
+
+ray_grid = tool_module('ray_grid')
+
+
+def brute_force(triangles, origins, directions, distance):
+    '''Every ray against every triangle.'''
+    grid = ray_grid.TriangleGrid(triangles)
+    n = len(origins)
+    ray = np.repeat(np.arange(n), len(triangles))
+    tri = np.tile(np.arange(len(triangles)), n)
+    t = grid.intersect(origins[ray], directions[ray], tri).reshape(n, -1).min(axis=1)
+    return np.where(t <= distance, t, np.inf)
+
+
+def random_triangles(rng, n, spread, size):
+    centres = rng.uniform(-spread, spread, (n, 1, 3))
+    return centres + rng.uniform(-size, size, (n, 3, 3))
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    triangles = random_triangles(rng, 300, 10, 1.5)
+
+    origins = rng.uniform(-12, 12, (2000, 3))
+    directions = rng.normal(size=(2000, 3))
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    distance = rng.uniform(0, 30, 2000)
+
+    got = ray_grid.TriangleGrid(triangles).ray_distances(origins, directions, distance)
+    expected = brute_force(triangles, origins, directions, distance)
+
+    assert np.isfinite(expected).sum() > 100
+    assert np.array_equal(np.isfinite(got), np.isfinite(expected))
+    assert np.allclose(got[np.isfinite(got)], expected[np.isfinite(expected)])
+
+
+def test_flat_scene_and_axis_aligned_rays():
+    # A floor of two triangles, with rays straight down and along it
+    triangles = np.array([
+        [(-5, -5, 0), (5, -5, 0), (5, 5, 0)],
+        [(-5, -5, 0), (5, 5, 0), (-5, 5, 0)],
+    ])
+    grid = ray_grid.TriangleGrid(triangles)
+
+    d = grid.ray_distances(
+        [(1, 2, 3), (1, 2, 3), (20, 0, 3), (-8, 0, 1)],
+        [(0, 0, -1), (0, 0, 1), (0, 0, -1), (1, 0, 0)],
+        [10, 10, 10, 100]
+    )
+    assert np.allclose(d[0], 3)
+    assert np.isinf(d[1:]).all()
+
+    # Too short to reach
+    assert np.isinf(grid.ray_distances([(0, 0, 3)], [(0, 0, -1)], 2.5)).all()
+
+
+def test_empty_grid():
+    grid = ray_grid.TriangleGrid(np.zeros((0, 3, 3)))
+    assert np.isinf(grid.ray_distances([(0, 0, 0)], [(0, 0, 1)], 10)).all()
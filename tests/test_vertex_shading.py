@@ -0,0 +1,103 @@
+import json
+
+import numpy as np
+
+from conftest import tool_module
+
+ray_grid = tool_module('ray_grid')
+vertex_shading = tool_module('vertex_shading')
+
+
+def quad(x0, x1, y0, y1, z):
+    return [
+        [(x0, y0, z), (x1, y0, z), (x1, y1, z)],
+        [(x0, y0, z), (x1, y1, z), (x0, y1, z)],
+    ]
+
+
+def floor_points(x, count):
+    '''Upward-facing points along y at the given x, on z = 0.'''
+    co = np.zeros((count, 3))
+    co[:, 0] = x
+    co[:, 1] = np.linspace(-20, 20, count)
+    normals = np.tile([0.0, 0.0, 1.0], (count, 1))
+    return vertex_shading.SamplePoints(co, normals)
+
+
+def test_ambient_occlusion_under_a_ceiling():
+    # A floor, and a ceiling 1 above the half of it where x < 0. Points
+    # well under the ceiling see it as an infinite plane; points further
+    # than the AO distance from its edge can't see it at all.
+    grid = ray_grid.TriangleGrid(quad(-100, 100, -100, 100, 0) + quad(-100, 0, -100, 100, 1))
+    under = floor_points(-50, 128)
+    outside = floor_points(10, 128)
+
+    settings = vertex_shading.AOSettings(samples=64, distance=5, falloff=0, bias=0.01)
+    assert (vertex_shading.ambient_occlusion(grid, outside, settings) == 1).all()
+
+    # Cosine-weighted rays at angle a from straight up reach the ceiling
+    # within the distance when cos(a) >= h / distance, which 1 - c^2 of
+    # them do.
+    c = (1 - settings.bias) / settings.distance
+    ao = vertex_shading.ambient_occlusion(grid, under, settings)
+    assert abs(ao.mean() - c * c) < 0.015
+
+    # With linear falloff, those hits only count 1 - d / distance:
+    # occlusion is the integral of (1 - c / cos) 2 cos over cos from c
+    # to 1.
+    settings.falloff = 1
+    ao = vertex_shading.ambient_occlusion(grid, under, settings)
+    occlusion = (1 - c * c) - 2 * c * (1 - c)
+    assert abs(ao.mean() - (1 - occlusion)) < 0.02
+
+
+def test_moving_a_light_relights_only_points_it_reaches():
+    # A floor of points lit by two point lights, with a wall between
+    # them casting shadows
+    grid = ray_grid.TriangleGrid([
+        [(0, -30, 0), (0, 30, 0), (0, 0, 10)],
+    ])
+    x, y = np.meshgrid(np.linspace(-30, 30, 61), np.linspace(-30, 30, 61))
+    co = np.stack([x.ravel(), y.ravel(), np.zeros(x.size)], axis=1)
+    points = vertex_shading.SamplePoints(co, np.tile([0.0, 0.0, 1.0], (len(co), 1)))
+    settings = vertex_shading.LightSettings()
+
+    def point_light(name, position):
+        return vertex_shading.BakeLight(
+            name, 'POINT', position, [0.0, 0.0, -1.0], [500.0, 400.0, 300.0], radius=12.0
+        )
+
+    lights = [point_light('Left', [-15.0, 0.0, 3.0]), point_light('Right', [3.0, 0.0, 3.0])]
+    colors = np.ones((len(co), 4), dtype=np.float32)
+    vertex_shading.relight(grid, lights, points, settings, colors, np.ones(len(co), dtype=bool))
+    record = vertex_shading.bake_record(lights, settings, 'geometry', len(co))
+    record = json.loads(json.dumps(record))
+
+    # The wall shadows the points behind it from the right light
+    behind_wall = (co[:, 0] < 0) & (np.linalg.norm(co - lights[1].position, axis=1) < 12)
+    assert (colors[behind_wall, :3] == np.float32(settings.ambient[0])).any()
+
+    moved = [lights[0], point_light('Right', [10.0, 5.0, 3.0])]
+    changed = vertex_shading.changed_points(record, moved, points, settings, 'geometry', len(co))
+    reach = lights[1].reaches(co) | moved[1].reaches(co)
+    assert np.array_equal(changed, reach)
+
+    relit = colors.copy()
+    vertex_shading.relight(grid, moved, points, settings, relit, changed)
+
+    # Points out of the moved light's old and new reach keep exactly what
+    # they had, including ones lit by the other light...
+    assert np.array_equal(relit[~changed], colors[~changed])
+    assert (colors[~changed & lights[0].reaches(co), 0] > settings.ambient[0]).any()
+
+    # ...and the rest match lighting everything from scratch.
+    full = np.ones_like(colors)
+    vertex_shading.relight(grid, moved, points, settings, full, np.ones(len(co), dtype=bool))
+    assert np.allclose(relit, full)
+    assert not np.array_equal(relit[changed], colors[changed])
+
+    # Nothing changed, nothing to relight
+    record = vertex_shading.bake_record(moved, settings, 'geometry', len(co))
+    assert not vertex_shading.changed_points(
+        record, moved, points, settings, 'geometry', len(co)
+    ).any()
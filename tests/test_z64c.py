@@ -0,0 +1,88 @@
+import os
+
+from conftest import tool_module
+
+z64c = tool_module('z64c')
+
+
+mixed_c = '''
+#include "ultra64.h"
+
+u64 gFirstTex[] = {
+#include "assets/textures/first.i4.inc.c"
+};
+
+u8 gNotTexture[] = {
+#include "assets/misc/not_texture.bin.inc.c"
+};
+
+u64 gTwoHalvesTex[] = {
+#include "assets/textures/half_a.i4.inc.c"
+#include "assets/textures/half_b.i4.inc.c"
+};
+
+/* u64 gCommentedTex[] = {
+#include "assets/textures/commented.i4.inc.c"
+}; */
+
+u64 gSecondTex[] = {
+#include "assets/textures/second.ia4.inc.c"
+};
+
+u64 gThirdTex[] = { 0x0123456789ABCDEF };
+'''
+
+
+def test_include_index_counts_single_u64_includes():
+    includes = z64c.CIncludeIndex(mixed_c)
+
+    assert len(includes) == 2
+    assert [block.name for block in includes.blocks] == ['gFirstTex', 'gSecondTex']
+    assert includes[1].include == 'assets/textures/second.ia4.inc.c'
+
+    block = includes[1]
+    assert mixed_c[block.start:block.end] == (
+        'u64 gSecondTex[] = {\n'
+        '#include "assets/textures/second.ia4.inc.c"\n'
+        '};'
+    )
+
+
+def test_replace_includes_skips_other_blocks():
+    buffer = z64c.CEditBuffer(mixed_c)
+    z64c.apply_c_diff(buffer, z64c.ReplaceIncludes(
+        path='map.c',
+        names=['gNewTex'],
+        includes=['assets/textures/new.i4.inc.c'],
+        first_index=1
+    ))
+
+    assert 'gSecondTex' not in buffer.text
+    assert 'u64 gNewTex[] = {\n#include "assets/textures/new.i4.inc.c"\n};' in buffer.text
+    assert '#include "assets/misc/not_texture.bin.inc.c"' in buffer.text
+    assert '#include "assets/textures/half_b.i4.inc.c"' in buffer.text
+
+
+def test_installed_inc_c_stays_newer_than_its_png(tmp_path):
+    oot = tmp_path / 'oot'
+    (oot / 'assets/textures').mkdir(parents=True)
+    (oot / 'build/assets/textures').mkdir(parents=True)
+
+    png = oot / 'assets/textures/foo.i4.png'
+    inc_c = oot / 'build/assets/textures/foo.i4.inc.c'
+    png.write_bytes(b'old png')
+    inc_c.write_bytes(b'same inc.c')
+    os.utime(inc_c, (1000, 1000))
+
+    new_png = tmp_path / 'foo.i4.png'
+    new_inc_c = tmp_path / 'foo.i4.inc.c'
+    new_png.write_bytes(b'new png')
+    new_inc_c.write_bytes(b'same inc.c')
+
+    z64c.install_diffs(str(oot), [
+        z64c.InstallFile(str(new_png), 'assets/textures/foo.i4.png'),
+        z64c.InstallFile(str(new_inc_c), 'build/assets/textures/foo.i4.inc.c'),
+    ])
+
+    assert png.read_bytes() == b'new png'
+    assert os.path.getmtime(inc_c) >= os.path.getmtime(png)
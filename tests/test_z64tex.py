@@ -0,0 +1,52 @@
+'''
+The texture encoders stand in for ZAPD's PNG to .inc.c step, so their
+output is checked against .inc.c text worked out by hand for small
+fixture PNGs.
+'''
+import numpy as np
+import pytest
+
+from conftest import tool_module
+
+z64tex = tool_module('z64tex')
+
+
+expected_inc_c = {
+    # Intensity's top nibble, first pixel of each pair high
+    'gray.i4.png': '    0x017F23E000000000, ',
+
+    # Four u64s a line, and an offset comment after each full line
+    'gradient.i4.png': (
+        '    0x0123456789ABCDEF, 0x123456789ABCDEF0, '
+        '0x23456789ABCDEF01, 0x3456789ABCDEF012,  // 0x000000\n'
+        '    0x456789ABCDEF0123, 0x56789ABCDEF01234, '
+        '0x6789ABCDEF012345, 0x789ABCDEF0123456,  // 0x000020\n'
+    ),
+
+    # Three bits of intensity, then one bit for any alpha at all
+    'alpha.ia4.png': '    0xF4309D6F00000000, ',
+
+    # Intensity nibble, then alpha nibble
+    'alpha.ia8.png': '    0xFF84100F00000000, ',
+
+    # Palette indices, with a five-colour palette and an odd number of
+    # pixels, so the last byte is padded with a zero nibble
+    'five_colours.ci4.png': '    0x0123401230000000, ',
+
+    'three_colours.ci8.png': '    0x0001020100000000, ',
+}
+
+
+@pytest.mark.parametrize('name', list(expected_inc_c))
+def test_encode_matches_known_inc_c(name, fixture_path, tmp_path):
+    out_path = str(tmp_path / name.replace('.png', '.inc.c'))
+
+    z64tex.convert(fixture_path(name), out_path)
+
+    with open(out_path) as f:
+        assert f.read() == expected_inc_c[name]
+
+
+def test_ci4_rejects_indices_past_15():
+    with pytest.raises(Exception):
+        z64tex.encode(np.full((2, 2), 16, dtype=np.uint8), 'ci4')
@@ -14,6 +14,7 @@ except FileNotFoundError:
 import bpy
 import functools
 import mathutils
+import numpy as np
 
 def clear_collection(coll):
     for obj in coll.objects:
@@ -61,22 +62,20 @@ def descendants(obj):
 
 
 def points_bounds(cos):
-    axis_vals = [
-        [co[axis] for co in cos]
-        for axis in [0, 1, 2]
-    ]
-    
+    cos = np.asarray(cos, dtype=np.float64).reshape(-1, 3)
+    if len(cos) == 0:
+        return Bounds()
+
     return Bounds([
-        Range(min(vals), max(vals))
-        for vals in axis_vals
+        Range(float(lo), float(hi))
+        for lo, hi in zip(cos.min(axis=0), cos.max(axis=0))
     ])
 
 
 def object_bounds(obj):
-    return points_bounds([
-        obj.matrix_world @ mathutils.Vector(v) 
-        for v in obj.bound_box
-    ])
+    return points_bounds(
+        apply_matrix(obj.matrix_world, np.array(obj.bound_box))
+    )
 
 
 def objects_bounds(objs):
@@ -105,6 +104,65 @@ def clip_object(obj1, obj2):
     #bpy.ops.object.modifier_apply(apply_as='DATA', modifier='mod')
 
 
+# Bulk mesh access. Going through foreach_get / foreach_set and numpy is
+# much faster than touching mesh elements one at a time from Python.
+
+def read_array(collection, attr, dtype=np.float32, width=1):
+    '''
+    attr of every item in a bpy collection, e.g. read_array(mesh.vertices,
+    'co', width=3). Comes back (N, width) if width > 1.
+    '''
+    values = np.empty(len(collection) * width, dtype=dtype)
+    collection.foreach_get(attr, values)
+    return values.reshape(-1, width) if width > 1 else values
+
+
+def write_array(collection, attr, values, dtype=None):
+    '''Set attr of every item in a bpy collection from an array.'''
+    values = np.asarray(values, dtype=dtype)
+    collection.foreach_set(attr, np.ascontiguousarray(values).ravel())
+
+
+def apply_matrix(matrix, co):
+    '''Transform (N, 3) points by a 4x4 matrix, all at once.'''
+    matrix = np.array(matrix, dtype=np.float64)
+    co = np.asarray(co, dtype=np.float64).reshape(-1, 3)
+    return co @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def world_vertex_cos(obj, mesh=None):
+    '''(N, 3) world-space positions of obj's vertices.'''
+    mesh = mesh or obj.data
+    return apply_matrix(obj.matrix_world, read_array(mesh.vertices, 'co', width=3))
+
+
+def read_colors(attr):
+    '''(N, 4) float colours of a colour attribute, in its own domain.'''
+    return read_array(attr.data, 'color', np.float32, 4)
+
+
+def write_colors(attr, colors):
+    write_array(attr.data, 'color', colors, np.float32)
+
+
+def evaluated_triangles(obj, depsgraph):
+    '''
+    The world-space triangles of obj with its modifiers applied, as an
+    (N, 3, 3) array, along with each triangle's material index.
+    '''
+    eval_obj = obj.evaluated_get(depsgraph)
+    mesh = eval_obj.to_mesh()
+    try:
+        mesh.calc_loop_triangles()
+        co = world_vertex_cos(eval_obj, mesh)
+        tri_verts = read_array(mesh.loop_triangles, 'vertices', np.int32, 3)
+        material_indices = read_array(mesh.loop_triangles, 'material_index', np.int32)
+    finally:
+        eval_obj.to_mesh_clear()
+
+    return co[tri_verts], material_indices
+
+
 def map_rect(from_rect, to_rect):
     ax0, ay0 = from_rect.origin
     bx0, by0 = to_rect.origin
@@ -131,5 +189,9 @@ class Image:
 
     @property
     def render_path(self):
-        os.makedirs(app.scene.render_dir, exist_ok=True)
-        return f'{app.scene.render_dir}/{self.name}.png'
+        return app.scene.artifacts.path(f'{self.name}.png')
+
+    @property
+    def inc_c_path(self):
+        '''Where we write this image converted to texture data; see z64tex.'''
+        return app.scene.artifacts.path(f'{self.name}.inc.c')
@@ -0,0 +1,232 @@
+'''
+Bake lighting into vertex colours without going through Cycles.
+
+Cycles can only bake the active object, and needs UVs and render
+settings set up first. Instead, this puts every visible mesh in the
+scene in one ray_grid.TriangleGrid and casts rays from each baked
+mesh's corners (or vertices, depending on the domain of the attribute
+being baked) against it, a chunk of rays at a time; see vertex_shading.
+
+The same goes for lights: bake_lights lights each point with every
+light in the scene, with shadows, and remembers the lights it used, so
+next time only points near lights that changed are relit.
+'''
+import json
+import time
+
+import bpy
+import numpy as np
+
+from . import ray_grid
+from . import render_cache
+from . import scene_split
+from .utils import *
+from .vertex_shading import *
+
+
+def bake_targets(scene):
+    '''
+    The meshes to bake. If there's a Geom to split into rooms, that's
+    where colours get painted, and the rooms get them when split.
+    '''
+    if scene_split.can_split(scene):
+        return [bpy.data.objects['Geom']]
+    return [
+        obj
+        for room in scene.rooms
+        for obj in room.geometry_objects
+    ]
+
+
+def occluders(scene, objects):
+    '''
+    Everything that casts shadows on objects: every mesh that renders,
+    apart from the tool's own helpers (like the rooms split from Geom,
+    which would double it up), and objects themselves.
+    '''
+    helpers = set(scene.helpers.all_objects)
+    occluders = [
+        obj for obj in bpy.data.objects
+        if obj.type == 'MESH'
+        and not obj.hide_render
+        and not getattr(obj, 'ignore_render', False)
+        and obj not in helpers
+    ]
+    return occluders + [obj for obj in objects if obj not in occluders]
+
+
+def scene_triangles(objects):
+    '''(N, 3, 3) world-space triangles of objects, modifiers applied.'''
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    return np.concatenate([
+        evaluated_triangles(obj, depsgraph)[0]
+        for obj in objects
+    ] or [np.empty((0, 3, 3))])
+
+
+def sample_points(obj, domain):
+    '''
+    One point per corner or per vertex. Corners face the way their
+    polygon does, so creases don't occlude themselves.
+    '''
+    mesh = obj.data
+    co = world_vertex_cos(obj)
+    normal_matrix = np.linalg.inv(np.array(obj.matrix_world)[:3, :3]).T
+
+    if domain == 'POINT':
+        normals = read_array(mesh.vertices, 'normal', width=3)
+    else:
+        loop_verts = read_array(mesh.loops, 'vertex_index', np.int32)
+        loop_totals = read_array(mesh.polygons, 'loop_total', np.int32)
+        poly_normals = read_array(mesh.polygons, 'normal', width=3)
+        co = co[loop_verts]
+        normals = np.repeat(poly_normals, loop_totals, axis=0)
+
+    normals = normals @ normal_matrix.T
+    normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+    return SamplePoints(co, normals)
+
+
+def scene_grid(triangles):
+    log(f"Ray grid of {len(triangles)} triangles")
+    return ray_grid.TriangleGrid(triangles)
+
+
+def write_gray(obj, name, values, domain):
+    '''Write per-point values as a gray colour attribute.'''
+    mesh = obj.data
+    attr = mesh.color_attributes.get(name)
+    if not attr:
+        attr = mesh.color_attributes.new(name, 'FLOAT_COLOR', domain)
+
+    colors = np.ones((len(values), 4), dtype=np.float32)
+    colors[:, :3] = values[:, None]
+    write_colors(attr, colors)
+
+
+def attribute_domain(obj, name):
+    '''Bake into an existing attribute's domain, or corners if it's new.'''
+    attr = obj.data.color_attributes.get(name)
+    return attr.domain if attr else 'CORNER'
+
+
+def bake_ao(scene, settings=None, objects=None):
+    '''
+    Bake ambient occlusion into the AO attribute of every mesh in the
+    scene, occluded by every visible mesh.
+    '''
+    settings = settings or AOSettings()
+    objects = objects or bake_targets(scene)
+
+    started = time.perf_counter()
+    grid = scene_grid(scene_triangles(occluders(scene, objects)))
+    log(f"Built ray grid in {time.perf_counter() - started:.2f}s")
+
+    for obj in objects:
+        obj_started = time.perf_counter()
+        domain = attribute_domain(obj, 'AO')
+        points = sample_points(obj, domain)
+        write_gray(obj, 'AO', ambient_occlusion(grid, points, settings), domain)
+        log(
+            f"Baked AO on {obj.name}: {len(points.co)} points x "
+            f"{settings.samples} rays in {time.perf_counter() - obj_started:.2f}s"
+        )
+
+    log(f"Baked AO in {time.perf_counter() - started:.2f}s")
+
+
+def bake_light(obj):
+    '''What bake_lights needs to know about a Blender light.'''
+    light = obj.data
+    matrix = np.array(obj.matrix_world)
+    direction = -matrix[:3, 2]
+    direction /= max(np.linalg.norm(direction), 1e-12)
+    color = np.array(light.color) * light.energy
+
+    radius = None
+    if light.type != 'SUN':
+        if light.use_custom_distance:
+            radius = light.cutoff_distance
+        else:
+            # Where inverse square falloff drops below 1/255
+            radius = float(np.sqrt(255 * color.max() / (4 * np.pi)))
+
+    return BakeLight(
+        name=obj.name,
+        # Area lights are lit like point lights
+        type=light.type if light.type in ['SUN', 'SPOT'] else 'POINT',
+        position=matrix[:3, 3].tolist(),
+        direction=direction.tolist(),
+        color=color.tolist(),
+        radius=radius,
+        spot_size=getattr(light, 'spot_size', 0),
+        spot_blend=getattr(light, 'spot_blend', 0),
+    )
+
+
+def scene_lights():
+    return [
+        bake_light(obj)
+        for obj in bpy.data.objects
+        if obj.type == 'LIGHT' and not obj.hide_render
+    ]
+
+
+def bake_lights(scene, settings=None, objects=None, full=False):
+    '''
+    Bake every light in the scene into the Light attribute of every mesh,
+    shadowed by every visible mesh. Points that no changed light reaches are
+    left alone, unless full is set.
+    '''
+    settings = settings or LightSettings()
+    objects = objects or bake_targets(scene)
+    lights = scene_lights()
+
+    started = time.perf_counter()
+    triangles = scene_triangles(occluders(scene, objects))
+    geometry_key = render_cache.key_of(triangles)
+    grid = None
+
+    for obj in objects:
+        obj_started = time.perf_counter()
+        mesh = obj.data
+        domain = attribute_domain(obj, 'Light')
+        points = sample_points(obj, domain)
+
+        attr = mesh.color_attributes.get('Light')
+        record = json.loads(mesh.get('BakedLights', '{}'))
+        if full or not attr:
+            changed = np.ones(len(points.co), dtype=bool)
+        else:
+            changed = changed_points(
+                record, lights, points, settings, geometry_key, len(attr.data)
+            )
+
+        if not changed.any():
+            log(f"Lighting on {obj.name} is up to date")
+            continue
+
+        if grid is None:
+            grid = scene_grid(triangles)
+
+        if attr and not changed.all():
+            colors = read_colors(attr)
+        else:
+            colors = np.ones((len(points.co), 4), dtype=np.float32)
+
+        relight(grid, lights, points, settings, colors, changed)
+
+        if not attr:
+            attr = mesh.color_attributes.new('Light', 'FLOAT_COLOR', domain)
+        write_colors(attr, colors)
+
+        mesh['BakedLights'] = json.dumps(
+            bake_record(lights, settings, geometry_key, len(points.co))
+        )
+
+        log(
+            f"Lit {changed.sum()}/{len(points.co)} points on {obj.name} with "
+            f"{len(lights)} lights in {time.perf_counter() - obj_started:.2f}s"
+        )
+
+    log(f"Baked lighting in {time.perf_counter() - started:.2f}s")
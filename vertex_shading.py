@@ -0,0 +1,249 @@
+'''
+The maths of baking light into vertex colours: ambient occlusion and
+lights at a set of world-space points, with rays (and shadow rays) cast
+through a ray_grid.TriangleGrid of the scene.
+
+Doesn't need bpy; see vertex_bake for the Blender side.
+'''
+from dataclasses import dataclass
+
+import numpy as np
+
+from .common_utils import *
+
+
+# Sample points per chunk
+chunk_points = 8192
+
+
+@dataclass
+class SamplePoints:
+    '''World-space points to bake, and their normals.'''
+    co: np.ndarray
+    normals: np.ndarray
+
+
+def hemisphere_directions(normals, samples, rng):
+    '''
+    (N, samples, 3) random cosine-weighted directions around each
+    normal.
+    '''
+    n = len(normals)
+    r = np.sqrt(rng.random((n, samples)))
+    phi = 2 * np.pi * rng.random((n, samples))
+    local = np.stack([
+        r * np.cos(phi),
+        r * np.sin(phi),
+        np.sqrt(np.maximum(0, 1 - r * r)),
+    ], axis=-1)
+
+    # An orthonormal basis around each normal (Duff et al. 2017)
+    x, y, z = normals[:, 0], normals[:, 1], normals[:, 2]
+    sign = np.where(z >= 0, 1.0, -1.0)
+    a = -1 / (sign + z)
+    b = x * y * a
+    tangent = np.stack([1 + sign * x * x * a, sign * b, -sign * x], axis=-1)
+    bitangent = np.stack([b, sign + y * y * a, -y], axis=-1)
+
+    return (
+        local[..., :1] * tangent[:, None]
+        + local[..., 1:2] * bitangent[:, None]
+        + local[..., 2:] * normals[:, None]
+    )
+
+
+@dataclass
+class AOSettings:
+    samples: int = 16
+    distance: float = 200.0
+    # How hits fade with distance: (1 - d / distance) ** falloff. 0 means
+    # any hit counts fully.
+    falloff: float = 1.0
+    # How far off the surface rays start, so they don't hit it
+    bias: float = 0.01
+    seed: int = 0
+
+
+def ambient_occlusion(grid, points, settings):
+    '''How unoccluded each point is, 0 to 1.'''
+    rng = np.random.default_rng(settings.seed)
+    ao = np.empty(len(points.co), dtype=np.float32)
+
+    for start in range(0, len(points.co), chunk_points):
+        end = min(start + chunk_points, len(points.co))
+        normals = points.normals[start:end]
+        origins = points.co[start:end] + normals * settings.bias
+
+        directions = hemisphere_directions(normals, settings.samples, rng)
+        d = grid.ray_distances(
+            np.repeat(origins, settings.samples, axis=0),
+            directions.reshape(-1, 3),
+            settings.distance
+        ).reshape(-1, settings.samples)
+
+        occlusion = np.where(
+            np.isfinite(d),
+            np.clip(1 - d / settings.distance, 0, 1) ** settings.falloff,
+            0
+        )
+        ao[start:end] = 1 - occlusion.mean(axis=1)
+
+        if len(points.co) > chunk_points:
+            log(f"    {end}/{len(points.co)} points")
+
+    return ao
+
+
+@dataclass
+class BakeLight:
+    '''What we need to know about a light to light vertices with it.'''
+    name: str
+    type: str
+    position: list
+    # Which way the light shines
+    direction: list
+    # Linear colour times energy
+    color: list
+    # Beyond this, point and spot lights light nothing. None for suns.
+    radius: float = None
+    spot_size: float = 0
+    spot_blend: float = 0
+
+    @property
+    def record(self):
+        '''Everything about the light that affects what it lights.'''
+        return [
+            self.type, self.position, self.direction, self.color,
+            self.radius, self.spot_size, self.spot_blend,
+        ]
+
+    def reaches(self, co):
+        '''Which points the light could light.'''
+        if self.radius is None:
+            return np.ones(len(co), dtype=bool)
+        return np.linalg.norm(co - self.position, axis=1) < self.radius
+
+
+@dataclass
+class LightSettings:
+    # Added to every point, lit or not
+    ambient: tuple = (0.3, 0.3, 0.3)
+    # How far off the surface shadow rays start, so they don't hit it
+    bias: float = 0.01
+    # How far shadow rays towards suns go
+    sun_distance: float = 1e5
+
+
+def light_points(grid, lights, points, settings):
+    '''(N, 3) light reaching each point: Lambert, shadowed, plus ambient.'''
+    total = np.empty((len(points.co), 3), dtype=np.float32)
+
+    for start in range(0, len(points.co), chunk_points):
+        end = min(start + chunk_points, len(points.co))
+        co = points.co[start:end]
+        normals = points.normals[start:end]
+        rgb = np.tile(np.array(settings.ambient, dtype=np.float64), (len(co), 1))
+
+        for light in lights:
+            if light.type == 'SUN':
+                to_light = np.tile(-np.array(light.direction), (len(co), 1))
+                distance = np.full(len(co), settings.sun_distance)
+                strength = np.ones(len(co))
+            else:
+                to_light = np.array(light.position) - co
+                distance = np.linalg.norm(to_light, axis=1)
+                to_light /= np.maximum(distance, 1e-12)[:, None]
+
+                # Inverse square, windowed to reach 0 at the radius
+                window = np.clip(1 - (distance / light.radius) ** 4, 0, 1) ** 2
+                strength = window / (4 * np.pi * np.maximum(distance, 1e-6) ** 2)
+
+                if light.type == 'SPOT':
+                    cos_angle = -(to_light @ np.array(light.direction))
+                    cos_outer = np.cos(light.spot_size / 2)
+                    cos_inner = np.cos(light.spot_size / 2 * (1 - light.spot_blend))
+                    t = np.clip(
+                        (cos_angle - cos_outer) / max(cos_inner - cos_outer, 1e-6),
+                        0, 1
+                    )
+                    strength = strength * t * t * (3 - 2 * t)
+
+            strength = strength * np.maximum(0, np.einsum('ij,ij->i', normals, to_light))
+
+            # Only lit points need shadow rays
+            lit = np.flatnonzero(strength > 0)
+            if len(lit):
+                hit = np.isfinite(grid.ray_distances(
+                    co[lit] + normals[lit] * settings.bias,
+                    to_light[lit],
+                    distance[lit] - settings.bias
+                ))
+                strength[lit[hit]] = 0
+
+            rgb += strength[:, None] * np.array(light.color)
+
+        total[start:end] = rgb
+
+        if len(points.co) > chunk_points:
+            log(f"    {end}/{len(points.co)} points")
+
+    return total
+
+
+def changed_points(record, lights, points, settings, geometry_key, count):
+    '''
+    Which points need relighting, given the record of the last bake: all
+    of them if the geometry, ambient light or a sun changed, otherwise
+    just the ones within reach of lights that were added, removed or
+    changed, where they used to be and where they are now.
+    '''
+    everything = np.ones(len(points.co), dtype=bool)
+    if (
+        record.get('geometry') != geometry_key
+        or record.get('ambient') != list(settings.ambient)
+        or record.get('points') != count
+    ):
+        return everything
+
+    old = record.get('lights', {})
+    new = {light.name: light for light in lights}
+
+    changed = np.zeros(len(points.co), dtype=bool)
+    for name in set(old) | set(new):
+        if name in new and old.get(name) == new[name].record:
+            continue
+
+        for light in [new.get(name), old_light(name, old.get(name))]:
+            if light is None:
+                continue
+            if light.type == 'SUN':
+                return everything
+            changed |= light.reaches(points.co)
+
+    return changed
+
+
+def old_light(name, record):
+    if record is None:
+        return None
+    type, position, direction, color, radius, spot_size, spot_blend = record
+    return BakeLight(name, type, position, direction, color, radius, spot_size, spot_blend)
+
+
+def bake_record(lights, settings, geometry_key, count):
+    '''What changed_points compares against next time.'''
+    return {
+        'geometry': geometry_key,
+        'ambient': list(settings.ambient),
+        'points': count,
+        'lights': {light.name: light.record for light in lights},
+    }
+
+
+def relight(grid, lights, points, settings, colors, changed):
+    '''
+    Light just the changed points into their rows of colors, an (N, 4)
+    array of the last bake. The rest are left exactly as they were.
+    '''
+    subset = SamplePoints(points.co[changed], points.normals[changed])
+    colors[changed, :3] = light_points(grid, lights, subset, settings)
@@ -35,12 +35,7 @@ name_tint = QColor(150,255,255,255)
 
 
 def get_nth_include_as_png(c_path, i):
-    with open(f'{oot}/{c_path}', 'rt') as f:
-        c = f.read()
-
-    ms = list(re.finditer(r'^#include "([^"]*?\.inc\.c)"', c, re.MULTILINE))
-    m = ms[i]
-    path = m.group(1)
+    path = z64c.read_includes(f'{oot}/{c_path}')[i].include
     path = path.replace('.inc.c', '.png')
     return path
 
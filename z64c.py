@@ -1,3 +1,5 @@
+import functools
+import os
 import re
 import shutil
 
@@ -57,36 +59,382 @@ class ReplaceIncludes:
 
 
 def read_array(oot, path, decl):
-    with open(f'{oot}/{path}', 'rt') as f:
+    """
+    Read and parse an array from a C file in the decomp. Parsed values
+    are cached until the file changes; each call gets its own copy of
+    the lists, so callers are free to modify them.
+    """
+    source = read_c_source(f'{oot}/{path}')
+    if decl not in source.values:
+        start, end = source.index.span(decl)
+        source.values[decl] = from_c(source.text[start:end])
+    return copy_c_value(source.values[decl])
+
+
+c_token_regex = re.compile(
+    r'\s*(?:'
+    r'(?P<comment>//[^\n]*|/\*.*?\*/)|'
+    r'(?P<directive>#(?:\\\n|[^\n])*)|'
+    r'(?P<string>"(?:\\.|[^"\\\n])*")|'
+    r'(?P<char>\'(?:\\.|[^\'\\\n])*\')|'
+    r'(?P<number>\.?\d(?:[eEpP][+-]|[\w.])*)|'
+    r'(?P<ident>[A-Za-z_]\w*)|'
+    r'(?P<punct>\S)'
+    r')',
+    flags=re.DOTALL
+)
+
+
+@dataclass
+class CToken:
+    kind: str
+    text: str
+    start: int
+    end: int
+
+
+def tokenize_c(c, start=0, end=None):
+    """
+    Split C source into tokens in a single pass. Comments and
+    preprocessor lines come out as single tokens, so braces inside
+    them never confuse anyone counting braces.
+
+    Token offsets are relative to the whole of c, even when only
+    c[start:end] is tokenized.
+    """
+    if end is None:
+        end = len(c)
+    for m in c_token_regex.finditer(c, start, end):
+        kind = m.lastgroup
+        yield CToken(kind, m.group(kind), m.start(kind), m.end(kind))
+
+
+class CArrayIndex:
+    """
+    The location of every array initializer in a C file, found by
+    walking the file once.
+
+    Spans cover the text between the initializer's outer braces, which
+    is what find_c_array has always returned. Arrays nested inside other
+    initializers aren't indexed; static arrays inside functions are.
+    """
+    def __init__(self, c):
+        self.spans = {}
+        self.item_indexes = {}
+
+        tokens = tokenize_c(c)
+        statement = []
+        for token in tokens:
+            if token.kind in ('comment', 'directive'):
+                continue
+
+            if token.text == '{' and statement and statement[-1].text == '=':
+                close = skip_braces(tokens)
+                name = array_declarator_name(statement[:-1])
+                if name and name not in self.spans:
+                    self.spans[name] = (token.end, close.start)
+                # Keep the statement going so we can handle
+                # 'int a[] = {...}, b[] = {...};'
+                statement = []
+                continue
+
+            if token.text in ';{}':
+                statement = []
+                continue
+
+            statement.append(token)
+
+    def __contains__(self, decl):
+        return decl in self.spans
+
+    def span(self, decl):
+        if decl not in self.spans:
+            raise Exception(
+                f"'{decl}' not found"
+            )
+        return self.spans[decl]
+
+    def items(self, c, decl):
+        """
+        The CArrayItems for decl. It's built the first time it's asked
+        for and kept up to date by shift() after that.
+        """
+        if decl not in self.item_indexes:
+            start, end = self.span(decl)
+            self.item_indexes[decl] = CArrayItems(c, start, end)
+        return self.item_indexes[decl]
+
+    def forget_items(self, decl):
+        """Call this when an edit changes how many items decl has."""
+        self.item_indexes.pop(decl, None)
+
+    def shift(self, start, end, new_length):
+        """
+        Update spans after c[start:end] has been replaced with
+        new_length characters, without rescanning the file.
+        """
+        delta = new_length - (end - start)
+        if delta == 0:
+            return
+
+        for decl, span in self.spans.items():
+            self.spans[decl] = shift_span(span, end, delta)
+
+        for items in self.item_indexes.values():
+            items.shift(start, end, new_length)
+
+
+class CArrayItems:
+    """
+    The location of every item in an array initializer, found by
+    walking it once. c[start:end] should be the text between the
+    initializer's braces.
+
+    Items are numbered like C array elements. Each item's span runs from
+    its first token to the comma after it, or to its last token if it's
+    the final item and has no trailing comma. Offsets are relative to the
+    whole of c, so one shift() keeps every CArrayItems for a file valid.
+
+    c can be a str or a CEditBuffer; only c[start:end] is read.
+    """
+    def __init__(self, c, start, end):
+        self.spans = []
+        self.children = {}
+
+        level = 0
+        item_start = None
+        item_end = None
+        for token in tokenize_c(c[start:end]):
+            if token.kind == 'comment':
+                continue
+
+            if level == 0 and token.text == ',':
+                self.spans.append((item_start, start + token.start))
+                item_start = None
+                continue
+
+            if level == 0 and item_start is None:
+                item_start = start + token.start
+            item_end = start + token.end
+
+            if token.text == '{':
+                level += 1
+            elif token.text == '}':
+                level -= 1
+                if level < 0:
+                    raise Exception("Got confused")
+
+        if item_start is not None:
+            self.spans.append((item_start, item_end))
+
+    def __len__(self):
+        return len(self.spans)
+
+    def span(self, index):
+        if not 0 <= index < len(self.spans):
+            return None
+        return self.spans[index]
+
+    def nested(self, c, index):
+        """
+        The CArrayItems inside item `index`, which must be a braced
+        list, e.g. the row of a 2D array.
+        """
+        if index not in self.children:
+            start, end = self.spans[index]
+            text = c[start:end].rstrip()
+            if not (text.startswith('{') and text.endswith('}')):
+                raise Exception(f"Item {index} isn't a braced list")
+            self.children[index] = CArrayItems(c, start + 1, start + len(text) - 1)
+        return self.children[index]
+
+    def forget_nested(self, index):
+        """Call this when an edit replaces item `index` wholesale."""
+        self.children.pop(index, None)
+
+    def shift(self, start, end, new_length):
+        delta = new_length - (end - start)
+        if delta == 0:
+            return
+
+        self.spans = [
+            shift_span(span, end, delta)
+            for span in self.spans
+        ]
+        for children in self.children.values():
+            children.shift(start, end, new_length)
+
+
+def shift_span(span, edit_end, delta):
+    """
+    Move span to account for an edit ending at edit_end that changed
+    the length of the text by delta. Spans containing the edit grow or
+    shrink; spans after it move.
+    """
+    a, b = span
+    if a > edit_end:
+        a += delta
+    if b >= edit_end:
+        b += delta
+    return a, b
+
+
+def skip_braces(tokens, body=None):
+    """
+    Consume tokens up to and including the '}' matching a '{' that
+    has just been consumed. Returns the closing token. If body is given,
+    the tokens in between are appended to it.
+    """
+    level = 1
+    for token in tokens:
+        if token.text == '{' and token.kind == 'punct':
+            level += 1
+        elif token.text == '}' and token.kind == 'punct':
+            level -= 1
+            if level == 0:
+                return token
+        if body is not None:
+            body.append(token)
+    raise Exception("Got confused: unbalanced braces")
+
+
+def array_declarator_name(tokens):
+    """
+    Given the tokens of a declaration up to (not including) its '=',
+    return the declared name if it's an array, e.g. 'sFoo' for
+    'static s16 sFoo[10][8]'.
+    """
+    i = len(tokens)
+    found_brackets = False
+    while i > 0 and tokens[i - 1].text == ']':
+        level = 0
+        while i > 0:
+            i -= 1
+            if tokens[i].text == ']':
+                level += 1
+            elif tokens[i].text == '[':
+                level -= 1
+                if level == 0:
+                    break
+        found_brackets = True
+
+    if found_brackets and i > 0 and tokens[i - 1].kind == 'ident':
+        return tokens[i - 1].text
+    return None
+
+
+include_regex = re.compile(r'#\s*include\s*"([^"]*)"\s*')
+semicolon_regex = re.compile(r'\s*;')
+
+
+@dataclass
+class IncludeBlock:
+    ordinal: int
+    name: str
+    include: str
+    start: int
+    end: int
+
+
+class CIncludeIndex:
+    """
+    Every include block in an asset C file, in order. An include block
+    looks like this:
+
+        u64 gFooTex[] = {
+        #include "assets/textures/foo.i4.inc.c"
+        };
+
+    Each block's span covers the whole declaration, from its type to its
+    semicolon.
+
+    Only u64 arrays holding exactly one include count, like the regex
+    ReplaceIncludes used to use, so other arrays don't shift the
+    numbering.
+    """
+    def __init__(self, c):
+        self.blocks = []
+
+        tokens = (token for token in tokenize_c(c) if token.kind != 'comment')
+        statement = []
+        for token in tokens:
+            if token.text == '{' and statement and statement[-1].text == '=':
+                body = []
+                close = skip_braces(tokens, body)
+                name = array_declarator_name(statement[:-1])
+                semicolon = semicolon_regex.match(c, close.end)
+                if (
+                    name and semicolon and statement[0].text == 'u64'
+                    and len(body) == 1 and body[0].kind == 'directive'
+                ):
+                    m = include_regex.fullmatch(body[0].text)
+                    if m:
+                        self.blocks.append(IncludeBlock(
+                            len(self.blocks),
+                            name,
+                            m.group(1),
+                            statement[0].start,
+                            semicolon.end()
+                        ))
+                statement = []
+                continue
+
+            if token.kind == 'directive' or token.text in ';{}':
+                statement = []
+                continue
+
+            statement.append(token)
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __getitem__(self, ordinal):
+        return self.blocks[ordinal]
+
+    def shift(self, start, end, new_length):
+        delta = new_length - (end - start)
+        if delta == 0:
+            return
+
+        for block in self.blocks:
+            block.start, block.end = shift_span((block.start, block.end), end, delta)
+
+
+@cached_by_file
+def read_includes(path):
+    """
+    The CIncludeIndex of an asset C file, cached until the file changes.
+    """
+    with open(path, 'rt') as f:
+        return CIncludeIndex(f.read())
+
+
+@functools.lru_cache(maxsize=32)
+def c_array_index(c):
+    return CArrayIndex(c)
+
+
+@dataclass
+class CSource:
+    text: str
+    index: CArrayIndex
+    values: dict = field(default_factory=dict)
+
+
+@cached_by_file
+def read_c_source(path):
+    """
+    Return a CSource holding the text of a C file, its array index, and
+    any arrays parsed from it so far. All of it is cached until the
+    file's mtime or size changes.
+    """
+    with open(path, 'rt') as f:
         c = f.read()
-    start, end = find_c_array(c, decl)
-    return from_c(c[start:end])
-    
+    return CSource(c, c_array_index(c))
 
-def find_c_array(c, decl):
-    regex = (
-        r'^\s*' +
-        r'(?:static )?' +
-        r'(?:[A-Za-z0-9_]+\*? )*' + 
-        re.escape(decl) +
-        r'\[.*?\]*' +
-        r'\s*=\s*\{' +
-        r'(.*?)' +
-        r'\}\s*;'
-    )
-    m = re.search(
-        regex,
-        c,
-        flags=re.MULTILINE | re.DOTALL
-    )
-    if not m:
-        log('==-==-==-==-==')
-        log(c)
-        raise Exception(
-            f"'{decl}' not found"
-        )
 
-    return m.span(1)
+def find_c_array(c, decl):
+    return c_array_index(c).span(decl)
 
     
 @yield_list
@@ -120,6 +468,8 @@ def to_c(value, format_hint=''):
         if format_hint == 'floor_ids':
             val_strs = [x.rjust(4) for x in val_strs]
         return '{ ' + ', '.join(val_strs) + ' }'
+    if isinstance(value, (CInt, CFloat)):
+        return value.text
     if isinstance(value, int):
         return str(value)
     if isinstance(value, float):
@@ -131,99 +481,44 @@ def to_c(value, format_hint=''):
 
 
 def find_array_item(text, find_index):
-    i = 0
-    index = 0
-    level = 0
-    found_start = None
-    found_end = None
-    block_comment = False
-    line_comment = False
-    while i < len(text):
-
-        char = text[i]
-
-        if line_comment and char == '\n':
-            line_comment = False
-            i += 1
-            continue
-
-        if char in ' \r\n\t':
-            i += 1
-            continue
-
-        if i + 1 < len(text) and char == '*' and text[i+1] == '/':
-            if not block_comment:
-                raise Exception("Got confused: found */ outside comment")
-            block_comment = False
-            i += 2
-            continue
-
-        if block_comment or line_comment:
-            i += 1
-            continue
-
-        if i + 1 < len(text) and char == '/' and text[i+1] == '/':
-            line_comment = True
-            i += 2
-            continue
-
-        if i + 1 < len(text) and char == '/' and text[i+1] == '*':
-            block_comment = True
-            i += 2
-            continue
-
-        if level == 0:
-            if index == find_index and found_start is None:
-                found_start = i
-
-            if char == ',':
-                index += 1
-
-            if index > find_index and found_end is None:
-                found_end = i
-
-        if char == '{':
-            level += 1
-
-        if char == '}':
-            level -= 1
-            if level < 0:
-                raise Exception("Got confused")
-            
-        i += 1
-
-    if found_start is None or found_end is None:
-        return None
-
-    return found_start, found_end
+    return CArrayItems(text, 0, len(text)).span(find_index)
     
 
-@yield_list
-def get_scene_table(oot):
-    path = f'{oot}/include/tables/scene_table.h'
+@cached_by_file
+def read_scene_table(path):
+    """
+    Parse scene_table.h into a dict of SceneTableEntry keyed by enum
+    name, in table order.
+    """
     with open(path, 'rt') as f:
         text = f.read()
 
+    table = {}
     for row in re.findall(rf'^/\* (0x..) \*/ DEFINE_SCENE\((.*?)\)', text, flags=re.MULTILINE):
 
         xs = [x.strip() for x in row[1].split(',')]
-        row = [row[0]] + xs
+        entry = SceneTableEntry(int(row[0], 0), *xs)
+        table[entry.enum_name] = entry
 
-        yield SceneTableEntry(*row)
+    return table
+
+
+def get_scene_table(oot):
+    return list(read_scene_table(f'{oot}/include/tables/scene_table.h').values())
 
 
 def get_scene_table_entry(oot, enum_name):
-    for x in get_scene_table(oot):
-        if x.enum_name == enum_name:
-            return x
-    raise Exception(f'{enum_name} is not a scene')
+    table = read_scene_table(f'{oot}/include/tables/scene_table.h')
+    if enum_name not in table:
+        raise Exception(f'{enum_name} is not a scene')
+    return table[enum_name]
 
 
 def get_english_title_card_asset_name(oot, enum_name):
     entry = get_scene_table_entry(oot, enum_name)
     segment = entry.title_card_segment
 
-    xml = z64xml.Z64XML(
+    xml = z64xml.load(
         f'{oot}/assets/xml/textures/place_title_cards.xml'
     )
     file_ = xml.get_file(segment)
@@ -234,7 +529,7 @@ def get_english_title_card_asset_name(oot, enum_name):
 def get_english_position_name_asset_name(oot, enum_name):
     entry = get_scene_table_entry(oot, enum_name)
 
-    xml = z64xml.Z64XML(
+    xml = z64xml.load(
         f'{oot}/assets/xml/textures/map_name_static.xml'
     )
     file_ = xml.get_file('map_name_static')
@@ -249,147 +544,528 @@ def get_scene_index(oot, enum_name):
     assert enum_name.startswith('SCENE_')
 
     path = f'{oot}/include/tables/scene_table.h'
-
-    with open(path, 'rt') as f:
-        text = f.read()
-    m = re.search(rf'^/\* (0x..) \*/ DEFINE_SCENE.*{enum_name}', text, flags=re.MULTILINE)
-    if not m:
+    table = read_scene_table(path)
+    if enum_name not in table:
         raise Exception(f"Can't find {enum_name} in {path}")
 
-    return int(m.group(1), 0)
+    return table[enum_name].index
         
 
-def from_c(text):
-    if '"' in text or '\'' in text:
-        raise Exception()
-    text = text.replace('{', '[')
-    text = text.replace('}', ']')
-    text = re.sub('//.*?$', '', text, flags=re.MULTILINE)
-    text = re.sub(r'/\*.*?\*/', '', text, flags=re.DOTALL)
-    text = re.sub(r'\b[A-Za-z_][A-Za-z0-9_]+', lambda m: '"' + m.group(0) + '"', text)
+class CInt(int):
+    """
+    An int read from C. It remembers how it was written, e.g. '0x04C4',
+    so that to_c writes it back the same way.
+    """
+    def __new__(cls, text):
+        digits = text.rstrip('uUlL')
+        if re.fullmatch(r'-?0[0-7]+', digits):
+            value = int(digits, 8)
+        else:
+            value = int(digits, 0)
+        self = super().__new__(cls, value)
+        self.text = text
+        self.radix = (
+            16 if 'x' in digits.lower() else
+            8 if value and digits.lstrip('-').startswith('0') else
+            10
+        )
+        return self
 
-    text = '[' + text + ']'
-    text = text.strip()
 
-    return eval(text)
+class CFloat(float):
+    """A float read from C, remembering how it was written, e.g. '9999.0f'."""
+    def __new__(cls, text):
+        digits = text.rstrip('fFlL')
+        if 'x' in digits.lower():
+            value = float.fromhex(digits)
+        else:
+            value = float(digits)
+        self = super().__new__(cls, value)
+        self.text = text
+        return self
 
 
-def install_diffs(oot, diffs):
-    for diff in diffs:
+class CIdent(str):
+    """An identifier read from C, e.g. 'F_1F' or 'gDekuTreeMapMarks'."""
 
-        if isinstance(diff, InstallFile):
-            log("Install", diff.to_path)
-            shutil.copyfile(diff.from_path, f'{oot}/{diff.to_path}')
 
-        elif isinstance(diff, CArray):
-            log("Write array", diff.decl)
-            with open(f'{oot}/{diff.path}', 'rt') as f:
-                c = f.read()
-            start, end = find_c_array(c, diff.decl)
+def from_c(text):
+    """
+    Parse the contents of a C initializer list, e.g. the text between
+    the braces of 's16 sFoo[] = { ... };', into a list.
+
+    Nested braces become lists, numbers become CInt and CFloat,
+    identifiers become CIdent. Simple constant arithmetic is evaluated;
+    anything more exotic raises an exception.
+    """
+    parser = CInitializerParser(text)
+    value = parser.parse_list()
+    if parser.token is not None:
+        parser.fail()
+    return value
+
+
+class CInitializerParser:
+    # Lowest precedence first
+    binary_operators = [
+        ['|'],
+        ['&'],
+        ['<<', '>>'],
+        ['+', '-'],
+        ['*', '/'],
+    ]
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = [
+            token
+            for token in tokenize_c(text)
+            if token.kind not in ('comment', 'directive')
+        ]
+        self.pos = 0
+
+    @property
+    def token(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def peek(self, text):
+        token = self.token
+        if token is None or token.kind != 'punct':
+            return False
+
+        # '<<' and '>>' come out of the tokenizer as two tokens
+        if len(text) == 2:
+            following = self.tokens[self.pos + 1] if self.pos + 1 < len(self.tokens) else None
+            return (
+                token.text == text[0] and
+                following is not None and
+                following.text == text[1] and
+                following.start == token.end
+            )
+
+        return token.text == text
+
+    def take(self, text):
+        if not self.peek(text):
+            return False
+        self.pos += len(text)
+        return True
+
+    def expect(self, text):
+        if not self.take(text):
+            self.fail()
+
+    def fail(self):
+        if self.token is None:
+            raise Exception("Can't parse C initializer: unexpected end")
+        context = self.text[self.token.start:self.token.start + 40]
+        raise Exception(f"Can't parse C initializer at {context!r}")
+
+    def parse_list(self):
+        items = []
+        while self.token is not None and not self.peek('}'):
+            items.append(self.parse_item())
+            if not self.take(','):
+                break
+        return items
+
+    def parse_item(self):
+        if self.take('{'):
+            items = self.parse_list()
+            self.expect('}')
+            return items
+        return self.parse_expression()
+
+    def parse_expression(self, level=0):
+        if level == len(self.binary_operators):
+            return self.parse_unary()
+
+        lhs = self.parse_expression(level + 1)
+        while True:
+            for operator in self.binary_operators[level]:
+                if self.peek(operator):
+                    break
+            else:
+                return lhs
+
+            self.take(operator)
+            rhs = self.parse_expression(level + 1)
+            lhs = self.evaluate(operator, lhs, rhs)
+
+    def parse_unary(self):
+        if self.take('+'):
+            return self.parse_unary()
+
+        if self.take('-'):
+            value = self.parse_unary()
+            # Keep the original text so -0x10 stays -0x10
+            if isinstance(value, CInt):
+                return CInt('-' + value.text)
+            if isinstance(value, CFloat):
+                return CFloat('-' + value.text)
+            return self.evaluate('-', 0, value)
+
+        if self.take('('):
+            value = self.parse_expression()
+            self.expect(')')
+            return value
+
+        token = self.token
+        if token is None:
+            self.fail()
+
+        if token.kind == 'number':
+            self.pos += 1
+            text = token.text
+            is_hex = text.lower().startswith('0x')
+            if '.' in text or 'p' in text.lower() or (not is_hex and 'e' in text.lower()):
+                return CFloat(text)
+            return CInt(text)
+
+        if token.kind == 'ident':
+            self.pos += 1
+            return CIdent(token.text)
+
+        self.fail()
+
+    def evaluate(self, operator, lhs, rhs):
+        if not all(isinstance(x, (int, float)) for x in [lhs, rhs]):
+            raise Exception(
+                f"Can't evaluate {lhs!r} {operator} {rhs!r} in C initializer"
+            )
 
-            array = to_c(diff.value)
-            array = unwrap_braces(array)
+        if operator == '/' and isinstance(lhs, int) and isinstance(rhs, int):
+            # C integer division truncates towards zero
+            return int(lhs / rhs)
 
-            c = c[:start] + array + c[end:]
+        return {
+            '|': lambda: lhs | rhs,
+            '&': lambda: lhs & rhs,
+            '<<': lambda: lhs << rhs,
+            '>>': lambda: lhs >> rhs,
+            '+': lambda: lhs + rhs,
+            '-': lambda: lhs - rhs,
+            '*': lambda: lhs * rhs,
+            '/': lambda: lhs / rhs,
+        }[operator]()
 
-            with open(f'{oot}/{diff.path}', 'wt') as f:
-                f.write(c)
 
+def copy_c_value(value):
+    """Copy the lists in a parsed C value. The leaves are immutable."""
+    if isinstance(value, list):
+        return [copy_c_value(x) for x in value]
+    return value
 
-        elif isinstance(diff, CArrayItem):
-            log(f"Write array item {diff.decl}[{diff.index}]")
 
-            with open(f'{oot}/{diff.path}', 'rt') as f:
-                c = f.read()
-                start, end = find_c_array(c, diff.decl)
+@dataclass
+class InstallReport:
+    path: str
+    edits: int
+    bytes_written: int
+    changed: bool = True
 
-                array = c[start:end]
 
-                istart, iend = find_array_item(array, diff.index)
-                array = array[:istart] + to_c(diff.value, diff.format_hint) + array[iend:]
+def install_diffs(oot, diffs):
+    """
+    Apply diffs to the decomp at oot.
 
-                c = c[:start] + array + c[end:]
+    Diffs are grouped by file. Each C file is read once, has all its
+    edits applied in memory, and is written once, atomically. Nothing is
+    written until every edit to every file has succeeded, so a bad diff
+    can't leave the decomp half-patched.
 
-            with open(f'{oot}/{diff.path}', 'wt') as f:
-                f.write(c)
+    Files whose contents wouldn't change are left alone, mtime and all,
+    so make doesn't rebuild anything on their account.
 
-        elif isinstance(diff, CArrayRange):
-            # TODO: All this array stuff is too hacky.
-            # It'll fail if the array is too short. It should be able
-            # to append.
+    Returns an InstallReport per file.
+    """
+    installs = []
+    edits = {}
+    for diff in diffs:
+        if isinstance(diff, InstallFile):
+            installs.append(diff)
+        elif isinstance(diff, (CArray, CArrayItem, CArrayRange, ReplaceIncludes)):
+            edits.setdefault(diff.path, []).append(diff)
+        else:
+            raise Exception()
 
-            log(f"Write array range {diff.decl} from {diff.index} count {diff.replace_count}")
+    old_sources = {}
+    new_sources = {}
+    for path, file_diffs in edits.items():
+        with open(f'{oot}/{path}', 'rt') as f:
+            c = old_sources[path] = f.read()
 
-            with open(f'{oot}/{diff.path}', 'rt') as f:
-                c = f.read()
-                start, end = find_c_array(c, diff.decl)
+        buffer = CEditBuffer(c)
+        for diff in file_diffs:
+            apply_c_diff(buffer, diff)
 
-                array = c[start:end]
+        new_sources[path] = buffer.text
 
-                first_index = diff.index
+    # Check every file to install exists before writing anything
+    from_hashes = [file_hash(diff.from_path) for diff in installs]
+    for diff, from_hash in zip(installs, from_hashes):
+        if from_hash is None:
+            raise Exception(f"Can't find {diff.from_path} to install")
 
-                log(array)
-                log('AAAAAA', diff.index)
-                range_start = find_array_item(array, diff.index)[0]
-                log('BBB', diff.index + diff.replace_count - 1)
-                range_end = find_array_item(array, diff.index + diff.replace_count - 1)[1]
+    reports = []
 
-                value_c = to_c(diff.value)
-                value_c = unwrap_braces(value_c)
+    for diff, from_hash in zip(installs, from_hashes):
+        to_path = f'{oot}/{diff.to_path}'
+        if from_hash == file_hash(to_path):
+            reports.append(InstallReport(diff.to_path, 1, 0, changed=False))
+            continue
 
-                array = array[:range_start] + value_c + array[range_end:]
+        log("Install", diff.to_path)
+        with atomic_write(to_path, 'wb') as f:
+            with open(diff.from_path, 'rb') as from_f:
+                shutil.copyfileobj(from_f, f)
+        reports.append(InstallReport(diff.to_path, 1, os.path.getsize(to_path)))
+
+    # We install our own build/assets/*.inc.c files next to their PNGs,
+    # and make remakes an .inc.c with ZAPD if its PNG is newer. So an
+    # .inc.c that didn't change still has to end up at least as new as
+    # a PNG that did.
+    for diff in installs:
+        if not (diff.to_path.startswith('build/') and diff.to_path.endswith('.inc.c')):
+            continue
+        to_path = f'{oot}/{diff.to_path}'
+        png_path = f'{oot}/{diff.to_path[len("build/"):-len(".inc.c")]}.png'
+        if os.path.exists(png_path) and os.path.getmtime(png_path) > os.path.getmtime(to_path):
+            os.utime(to_path)
+
+    for path, c in new_sources.items():
+        if c == old_sources[path]:
+            reports.append(InstallReport(path, len(edits[path]), 0, changed=False))
+            continue
 
-                c = c[:start] + array + c[end:]
+        with atomic_write(f'{oot}/{path}', 'wt') as f:
+            f.write(c)
+        reports.append(InstallReport(
+            path,
+            len(edits[path]),
+            os.path.getsize(f'{oot}/{path}')
+        ))
+
+    for report in reports:
+        if report.changed:
+            log(f"Wrote {report.path}: {report.edits} edits, {report.bytes_written} bytes")
+        else:
+            log(f"Unchanged {report.path}: {report.edits} edits")
+
+    num_changed = sum(report.changed for report in reports)
+    log(f"{num_changed} of {len(reports)} files changed")
+
+    return reports
+
+
+class CEditBuffer:
+    """
+    A C file being edited in memory.
+
+    Edits are kept as a sorted list of non-overlapping replacements of
+    the original text, and the new text is only put together when .text
+    is asked for. So many small edits to a big file cost about the size
+    of the edits, not the size of the file each time.
+
+    Offsets passed to replace() and used for slicing are offsets into the
+    current, edited text. .arrays and .includes are the file's
+    CArrayIndex and CIncludeIndex. They're built when first asked for and
+    kept in step with every edit after that.
+    """
+    def __init__(self, text):
+        self.original = text
+        self.edits = []
+        self._text = text
+        self._arrays = None
+        self._includes = None
+
+    @property
+    def arrays(self):
+        if self._arrays is None:
+            self._arrays = CArrayIndex(self.text)
+        return self._arrays
+
+    @property
+    def includes(self):
+        if self._includes is None:
+            self._includes = CIncludeIndex(self.text)
+        return self._includes
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = ''.join(
+                string[string_start:string_start + length]
+                for _, string, string_start, length in self.segments()
+            )
+        return self._text
 
-            with open(f'{oot}/{diff.path}', 'wt') as f:
-                f.write(c)
+    def __len__(self):
+        return len(self.original) + sum(
+            len(text) - (end - start)
+            for start, end, text in self.edits
+        )
 
-        elif isinstance(diff, ReplaceIncludes):
-            log(f"Replace {len(diff.includes)} includes from {diff.first_index} in {diff.path}")
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError("CEditBuffer only supports simple slices")
+        start = 0 if key.start is None else key.start
+        end = len(self) if key.stop is None else key.stop
+        return self.read(start, end)
+
+    def segments(self):
+        """
+        The current text as a sequence of pieces of either the original
+        text or replacement text. Yields tuples of
+        (current offset, string, offset in string, length).
+        """
+        pos = 0
+        delta = 0
+        for start, end, text in self.edits:
+            if start > pos:
+                yield pos + delta, self.original, pos, start - pos
+            yield start + delta, text, 0, len(text)
+            delta += len(text) - (end - start)
+            pos = end
+        yield pos + delta, self.original, pos, len(self.original) - pos
+
+    def read(self, start, end):
+        if self._text is not None:
+            return self._text[start:end]
+
+        pieces = []
+        for offset, string, string_start, length in self.segments():
+            if offset >= end:
+                break
+            a = max(start, offset) - offset
+            b = min(end, offset + length) - offset
+            if a < b:
+                pieces.append(string[string_start + a:string_start + b])
+        return ''.join(pieces)
+
+    def replace(self, start, end, text):
+        """Replace self[start:end] with text."""
+
+        # Skip edits that end before this one starts, tracking how far
+        # they've moved things.
+        i = 0
+        delta = 0
+        while i < len(self.edits):
+            edit_start, edit_end, edit_text = self.edits[i]
+            if edit_start + delta + len(edit_text) >= start:
+                break
+            delta += len(edit_text) - (edit_end - edit_start)
+            i += 1
 
-            with open(f'{oot}/{diff.path}', 'rt') as f:
-                c = f.read()
+        # Edits i to j overlap or touch this one, so merge them.
+        j = i
+        end_delta = delta
+        while j < len(self.edits):
+            edit_start, edit_end, edit_text = self.edits[j]
+            if edit_start + end_delta > end:
+                break
+            end_delta += len(edit_text) - (edit_end - edit_start)
+            j += 1
+
+        if i == j:
+            new_edit = [start - delta, end - delta, text]
+        else:
+            window_start = min(start, self.edits[i][0] + delta)
+            window_end = max(end, self.edits[j - 1][1] + end_delta)
+            new_edit = [
+                window_start - delta,
+                window_end - end_delta,
+                self.read(window_start, start) + text + self.read(end, window_end)
+            ]
+
+        self.edits[i:j] = [new_edit]
+        self._text = None
+        for index in [self._arrays, self._includes]:
+            if index is not None:
+                index.shift(start, end, len(text))
+
+
+def apply_c_diff(buffer, diff):
+    """
+    Apply one diff to a CEditBuffer.
+    """
+    index = buffer.arrays
+
+    if isinstance(diff, CArray):
+        log("Write array", diff.decl)
+        start, end = index.span(diff.decl)
+
+        array = to_c(diff.value)
+        array = unwrap_braces(array)
+
+        buffer.replace(start, end, array)
+        index.forget_items(diff.decl)
+
+    elif isinstance(diff, CArrayItem):
+        log(f"Write array item {diff.decl}[{diff.index}]")
+
+        items = index.items(buffer, diff.decl)
+        span = items.span(diff.index)
+        if span is None:
+            raise Exception(f"{diff.decl} has no item {diff.index}")
+        istart, iend = span
+
+        item = to_c(diff.value, diff.format_hint)
+
+        buffer.replace(istart, iend, item)
+        items.forget_nested(diff.index)
+
+    elif isinstance(diff, CArrayRange):
+        # TODO: All this array stuff is too hacky.
+        # It'll fail if the array is too short. It should be able
+        # to append.
+
+        log(f"Write array range {diff.decl} from {diff.index} count {diff.replace_count}")
+
+        items = index.items(buffer, diff.decl)
+        last_index = diff.index + diff.replace_count - 1
+        if items.span(diff.index) is None or items.span(last_index) is None:
+            raise Exception(
+                f"{diff.decl} has {len(items)} items; "
+                f"can't replace {diff.index} to {last_index}"
+            )
 
-            skip = diff.first_index
-            includes = diff.includes[:]
-            n = len(includes)
-            done = 0
-            log('---')
-            log(c)
-            log('---')
+        range_start = items.span(diff.index)[0]
+        range_end = items.span(last_index)[1]
 
-            def sub(m):
-                log(m)
-                log('=>', m.group(0))
-                nonlocal skip
-                nonlocal done
-                if skip:
-                    skip -= 1
-                    return m.group(0)
+        value_c = to_c(diff.value)
+        value_c = unwrap_braces(value_c)
 
-                i = n - len(includes)
-                name = diff.names[i]
-                include = includes.pop(0)
-                done += 1
-                return f'u64 {name}[] = {{\n#include "{include}"\n}};'
+        buffer.replace(range_start, range_end, value_c)
+        index.forget_items(diff.decl)
 
-            c = re.sub(
-                r'^u64 .*?\] = \{\n#include.*?\n\};',
-                sub,
-                c,
-                count=skip + len(includes),
-                flags=re.MULTILINE
-            )
+    elif isinstance(diff, ReplaceIncludes):
+        log(f"Replace {len(diff.includes)} includes from {diff.first_index} in {diff.path}")
 
-            if done != n:
-                raise Exception(f"Only managed to replace {done} of {n} includes.")
+        includes = buffer.includes
+        n = len(diff.includes)
+        available = max(0, min(n, len(includes) - diff.first_index))
+        if available != n:
+            raise Exception(f"Only managed to replace {available} of {n} includes.")
 
-            with open(f'{oot}/{diff.path}', 'wt') as f:
-                f.write(c)
+        for i, (name, include) in enumerate(zip(diff.names, diff.includes)):
+            block = includes[diff.first_index + i]
+            log('=>', buffer[block.start:block.end])
+            buffer.replace(
+                block.start,
+                block.end,
+                f'u64 {name}[] = {{\n#include "{include}"\n}};'
+            )
+            block.name = name
+            block.include = include
 
+        # The renamed arrays will be re-indexed if anyone asks for them.
+        buffer._arrays = None
 
-        else:
-            raise Exception()
+    else:
+        raise Exception()
 
 
 def unwrap_braces(text):
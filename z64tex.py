@@ -0,0 +1,97 @@
+'''
+Encode images as N64 textures.
+
+The decomp's build normally has ZAPD turn each texture PNG into an
+.inc.c file. We can do that ourselves as we export, which means ZAPD
+doesn't have anything to do for our textures when building, and we
+control exactly which bytes go into the ROM.
+
+Pixels are converted the way ZAPD converts them: grayscale formats take
+their intensity from the red channel, and 4bpp formats put the first
+pixel of each pair in the high nibble.
+'''
+import numpy as np
+import PIL.Image
+
+
+formats = ['i4', 'ia4', 'ia8', 'ci4', 'ci8']
+
+
+def format_from_path(path):
+    '''The texture format from a ZAPD-style name like foo.ia4.png.'''
+    fmt = path.split('.')[-2]
+    if fmt not in formats:
+        raise Exception(f"Don't know what texture format {path} is")
+    return fmt
+
+
+def encode(image, fmt):
+    '''Encode a PIL image, or a numpy array of palette indices, to bytes.'''
+    if fmt in ['ci4', 'ci8']:
+        indices = np.asarray(image)
+        if indices.ndim != 2:
+            raise Exception(f"{fmt} textures need a palette image")
+        if fmt == 'ci4':
+            if indices.max(initial=0) > 15:
+                raise Exception("ci4 textures can only use palette indices 0-15")
+            return pack_4bpp(indices)
+        return indices.astype(np.uint8).tobytes()
+
+    rgba = np.asarray(image.convert('RGBA'))
+    i = rgba[:, :, 0]
+    a = rgba[:, :, 3]
+
+    if fmt == 'i4':
+        return pack_4bpp(i >> 4)
+    if fmt == 'ia4':
+        return pack_4bpp(((i >> 5) << 1) | (a != 0))
+    if fmt == 'ia8':
+        return (((i >> 4) << 4) | (a >> 4)).astype(np.uint8).tobytes()
+
+    raise Exception(f"Unknown texture format {fmt}")
+
+
+def pack_4bpp(nibbles):
+    nibbles = np.asarray(nibbles, dtype=np.uint8).ravel()
+    if len(nibbles) % 2:
+        nibbles = np.append(nibbles, np.uint8(0))
+    return ((nibbles[0::2] << 4) | nibbles[1::2]).tobytes()
+
+
+def inc_c(data):
+    '''
+    Texture data as the body of a u64 array, laid out like ZAPD lays it
+    out: four u64s per line, each line commented with its offset.
+    '''
+    if len(data) % 8:
+        data = data + bytes(8 - len(data) % 8)
+
+    digits = data.hex().upper()
+    words = [f'0x{digits[i:i + 16]}, ' for i in range(0, len(digits), 16)]
+
+    lines = []
+    for i in range(0, len(words), 4):
+        line = '    ' + ''.join(words[i:i + 4])
+        if len(words[i:i + 4]) == 4:
+            line += ' // 0x%06X\n' % (i * 8)
+        lines.append(line)
+    return ''.join(lines)
+
+
+def write(data, path):
+    '''Write texture data to an .inc.c file, or raw to anything else.'''
+    if path.endswith('.inc.c'):
+        with open(path, 'wt') as f:
+            f.write(inc_c(data))
+    else:
+        with open(path, 'wb') as f:
+            f.write(data)
+
+
+def convert(png_path, out_path, fmt=None):
+    '''
+    Encode a PNG to an .inc.c or .bin file. The format defaults to the
+    one in the PNG's name.
+    '''
+    fmt = fmt or format_from_path(png_path)
+    write(encode(PIL.Image.open(png_path), fmt), out_path)
@@ -2,15 +2,36 @@ import xml.etree.ElementTree as ET
 
 from .common_utils import *
 
+
+@cached_by_file
+def load(path):
+    """
+    Parse a ZAPD asset XML. Parsed documents are shared until the file
+    changes on disk.
+    """
+    return Z64XML(path)
+
+
 class Z64XML:
     def __init__(self, path):
         self.path = path
         self.doc = ET.parse(path)
         self.root = self.doc.getroot()
 
+        # Name -> File node. First one wins, as with find().
+        self.file_nodes = {}
+        for node in self.root.iter('File'):
+            self.file_nodes.setdefault(node.attrib.get('Name'), node)
+
+        self.files = {}
+
     def get_file(self, name):
-        node = self.root.find(f'.//File[@Name="{name}"]')
-        return Z64File(self, node)
+        if name not in self.files:
+            node = self.file_nodes.get(name)
+            if node is None:
+                raise Exception(f"No File named {name} in {self.path}")
+            self.files[name] = Z64File(self, node)
+        return self.files[name]
 
 
 class Z64File:
@@ -18,7 +39,7 @@ class Z64File:
         self.xml = xml
         self.node = node
 
-    @property
+    @cached_property
     @yield_list
     def textures(self):
         for child in self.node.findall('./Texture'):